@@ -1,20 +1,42 @@
 from math import exp, log
+from operator import attrgetter
 import random
 from statistics import mean
 
 
 class Agent(object):
+    # Slots instead of a __dict__ per agent: a large population is held in
+    # memory for the whole run (and in every branch of a fork), and its
+    # attributes are read in the innermost loops of every tick. The history
+    # itself keeps as_dict() rows, not agents
+    __slots__ = [
+        "id",
+        "beh",
+        "current_risk",
+        "current_attempt",
+        "attempts",
+        "emulatable_alters",
+        "recruited_alters",
+        "recruit_candidates",
+        "pruned_alters",
+        "current_emulations",
+        "current_emulated_risk_factors",
+        "current_spon_changes",
+        "current_spon_risk_factors",
+        "enrolled",
+    ]
+
     def __init__(self, id, n_beh, baserates=None) -> None:
         assert (baserates is None) or (len(baserates) == n_beh)
         assert (baserates is None) or all([(0 <= b) and (b <= 1) for b in baserates])
 
         self.id = id
-        self.name = f"id_{id}"
         self.current_risk = 0
         self.current_attempt = 0
         self.attempts = 0
         self.emulatable_alters = 0
         self.recruited_alters = 0
+        self.recruit_candidates = 0
         self.pruned_alters = 0
         self.current_emulations = 0
         self.current_emulated_risk_factors = 0
@@ -27,10 +49,16 @@ class Agent(object):
         else:
             self.beh = [int(random.random() < 0.50) for _ in range(n_beh)]
 
+    @property
+    def name(self):
+        # The agent's vertex name, derived from its id when needed. Lookups in
+        # the tick go by id instead (see alters())
+        return f"id_{self.id}"
+
     def __str__(self) -> str:
         return f"{self.name}: {'-'.join([str(b) for b in self.beh])}"
 
-    def as_dict(self, agents=None, network=None, beh_as_list=False) -> dict:
+    def as_dict(self, agents=None, network=None, beh_as_list=False, by_id=None) -> dict:
         dic = {
             "id": self.id,
             "name": self.name,
@@ -49,10 +77,9 @@ class Agent(object):
         }
 
         if (agents is not None) and (network is not None):
-            if self.alters(agents, network):
-                mean_sim = mean(
-                    [self.similarity(a) for a in self.alters(agents, network)]
-                )
+            alters = self.alters(agents, network, by_id)
+            if alters:
+                mean_sim = mean([self.similarity(a) for a in alters])
             else:
                 mean_sim = None
             dic.update({"mean_similarity": mean_sim})
@@ -68,11 +95,11 @@ class Agent(object):
             if random.random() < p:
                 self.beh[i] = alter_beh
 
-    def emulate_alters(self, agents, network, p):
+    def emulate_alters(self, agents, network, p, by_id=None, metrics=None):
         self.current_emulations = 0
         self.current_emulated_risk_factors = 0
 
-        alters = self.alters(agents, network)
+        alters = self.alters(agents, network, by_id, metrics)
 
         self.emulatable_alters = len(alters)
 
@@ -101,68 +128,147 @@ class Agent(object):
         return self
 
     def similarity(self, alter):
-        sim = mean([self.beh[i] == alter.beh[i] for i, b in enumerate(self.beh)])
+        # Same value as statistics.mean() of the matches (both round the exact
+        # proportion once), without its exact fraction arithmetic
+        matches = [self.beh[i] == alter.beh[i] for i, b in enumerate(self.beh)]
+        sim = sum(matches) / len(matches)
 
         return sim
 
-    def recruit_alters(self, agents, network, sim_thresh=0.50):
+    def recruit_alters(
+        self,
+        agents,
+        network,
+        sim_thresh=0.50,
+        index=None,
+        k=None,
+        by_id=None,
+        metrics=None,
+    ):
         self.recruited_alters = 0
 
-        neighborhood = network.neighborhood(self.network_index(network))
-        pot_alters = [a for a in agents if a.network_index(network) not in neighborhood]
+        self_index = self.vertex_index(network, by_id)
+        neighborhood = network.neighborhood(self_index)
+
+        # Neighbors are told apart by id where that is their vertex index
+        if by_id is not None:
+            key, neighbors = attrgetter("id"), set(neighborhood)
+        else:
+            key, neighbors = attrgetter("name"), set(network.vs[neighborhood]["name"])
+
+        if k is not None:
+            # Consider only k non-neighbors, drawn without replacement. A random
+            # order of enough agents always holds k non-neighbors (or all of
+            # them), and its first k are a uniform sample of non-neighbors
+            n_draws = min(len(agents), k + len(neighborhood))
+            draws = [agents[i] for i in random.sample(range(len(agents)), n_draws)]
+            pot_alters = [a for a in draws if key(a) not in neighbors][0:k]
+        else:
+            # A BehaviorIndex narrows the candidates down to agents similar
+            # enough to recruit, in the same order a full scan would visit them
+            if index is not None:
+                candidates = index.similar_agents(self, sim_thresh)
+            else:
+                candidates = agents
 
+            pot_alters = [a for a in candidates if key(a) not in neighbors]
+
+        self.recruit_candidates = len(pot_alters)
+
+        if metrics is not None:
+            metrics.count("alter_lookups")
+            metrics.count("similarity_evals", self.recruit_candidates)
+
+        new_edges = []
         for alter in pot_alters:
             similar_enough = self.similarity(alter) >= sim_thresh
             if similar_enough:
-                new_edge = (self.network_index(network), alter.network_index(network))
-                network.add_edges([new_edge])
+                new_edges.append((self_index, alter.vertex_index(network, by_id)))
                 self.recruited_alters += 1
 
+        network.add_edges(new_edges)
+
         return self
 
-    def prune_alters(self, agents, network, sim_thresh=0.50):
+    def prune_alters(self, agents, network, sim_thresh=0.50, by_id=None, metrics=None):
         self.pruned_alters = 0
 
-        alters = self.alters(agents, network)
+        self_index = self.vertex_index(network, by_id)
+        alters = self.alters(agents, network, by_id, metrics)
+
+        if metrics is not None:
+            metrics.count("similarity_evals", len(alters))
 
+        bad_edges = []
         for alter in alters:
             if self.similarity(alter) < sim_thresh:
-                bad_edge = (self.network_index(network), alter.network_index(network))
-                network.delete_edges([bad_edge])
+                bad_edges.append((self_index, alter.vertex_index(network, by_id)))
                 self.pruned_alters += 1
 
+        network.delete_edges(bad_edges)
+
         return self
 
     def network_index(self, network):
-        return network.vs["name"].index(self.name)
+        # looked up through igraph's index of vertex names
+        return network.vs.find(name=self.name).index
+
+    def vertex_index(self, network, by_id=None):
+        # The agent's id, where by_id says that ids are vertex indices (see
+        # alters()), and otherwise looked up by name
+        if by_id is not None:
+            return self.id
+
+        return self.network_index(network)
+
+    def alters(self, agents, network, by_id=None, metrics=None):
+        # by_id, the agents listed by id, is for networks whose vertex indices
+        # are the agents' ids (as in a Simulation). The alters are then read
+        # off the agent's adjacency, instead of matching every agent's name
+        # against its neighbors' names. The lookup is counted in `metrics`, if
+        # given (a SimulationMetrics)
+        if metrics is not None:
+            metrics.count("alter_lookups")
+
+        if by_id is not None:
+            return [by_id[i] for i in network.neighbors(self.id)]
 
-    def alters(self, agents, network):
         cur_agent_index = self.network_index(network)
         alter_indices = network.neighbors(cur_agent_index)
-        alters = [a for a in agents if a.network_index(network) in alter_indices]
+        alter_names = set(network.vs[alter_indices]["name"])
+        alters = [a for a in agents if a.name in alter_names]
 
         return alters
 
-    def suicide_risk(self, odds_ratios, gen_sui_prev, gen_ave_beh):
-
+    @staticmethod
+    def risk_coefs(odds_ratios, gen_sui_prev, gen_ave_beh):
         intercept = log(gen_sui_prev / (1 - gen_sui_prev))
         b = [log(odds_ratio) for odds_ratio in odds_ratios]
-        log_odds = sum([b_i * beh_i for b_i, beh_i in zip(b, self.beh)])
 
         # Adjustment so that an agent with sum(beh) == ave_beh will also have
         # A suicide risk equal to gen_sui_prev. This allows from some agents to
         # be healthier than the average person from the general population.
         log_odds_adjustment = mean(b) * gen_ave_beh
 
+        return intercept, b, log_odds_adjustment
+
+    def suicide_risk(self, odds_ratios, gen_sui_prev, gen_ave_beh, coefs=None):
+        # coefs are risk_coefs() of the other arguments, if already computed
+        if coefs is None:
+            coefs = self.risk_coefs(odds_ratios, gen_sui_prev, gen_ave_beh)
+        intercept, b, log_odds_adjustment = coefs
+
+        log_odds = sum([b_i * beh_i for b_i, beh_i in zip(b, self.beh)])
+
         p = 1 / (1 + exp(-(intercept + log_odds - log_odds_adjustment)))
 
         self.current_risk = p
 
         return p
 
-    def consider_suicide(self, odds_ratios, gen_sui_prev, gen_ave_beh):
+    def consider_suicide(self, odds_ratios, gen_sui_prev, gen_ave_beh, coefs=None):
 
-        cur_risk = self.suicide_risk(odds_ratios, gen_sui_prev, gen_ave_beh)
+        cur_risk = self.suicide_risk(odds_ratios, gen_sui_prev, gen_ave_beh, coefs)
         attempt_yn = int(random.random() < cur_risk)
 
         if attempt_yn:
@@ -0,0 +1,88 @@
+from itertools import combinations
+from math import comb
+
+
+class BehaviorIndex:
+    # Agents grouped by behavior profile. Behaviors are short binary vectors, so
+    # the agents similar enough to recruit are exactly those whose profiles lie
+    # within a small Hamming distance, and recruitment can visit only those
+    # buckets instead of scanning the whole population.
+    #
+    # The index must be told whenever an agent's behaviors change (update) and
+    # whenever the agent list is reordered (reorder).
+
+    def __init__(self, agents):
+        self.buckets = {}  # profile -> {agent id: agent}
+        self.profiles = {}  # agent id -> profile
+        self.positions = {}  # agent id -> position in the agent list
+
+        for agent in agents:
+            self.update(agent)
+
+        self.reorder(agents)
+
+    def update(self, agent):
+        profile = tuple(agent.beh)
+        old_profile = self.profiles.get(agent.id)
+
+        if profile == old_profile:
+            return self
+
+        if old_profile is not None:
+            bucket = self.buckets[old_profile]
+            del bucket[agent.id]
+            if not bucket:
+                del self.buckets[old_profile]
+
+        self.buckets.setdefault(profile, {})[agent.id] = agent
+        self.profiles[agent.id] = profile
+
+        return self
+
+    def reorder(self, agents):
+        self.positions = {agent.id: i for i, agent in enumerate(agents)}
+
+        return self
+
+    @staticmethod
+    def max_distance(n_beh, sim_thresh):
+        # Largest Hamming distance whose similarity, computed as a proportion of
+        # matching behaviors like Agent.similarity(), still reaches sim_thresh
+        distances = [h for h in range(n_beh + 1) if (n_beh - h) / n_beh >= sim_thresh]
+
+        return max(distances, default=-1)
+
+    def profiles_within(self, profile, radius):
+        n_beh = len(profile)
+        n_nearby = sum([comb(n_beh, h) for h in range(radius + 1)])
+
+        # Enumerate every nearby profile, or check every occupied one, whichever
+        # is fewer
+        if n_nearby < len(self.buckets):
+            for h in range(radius + 1):
+                for flips in combinations(range(n_beh), h):
+                    nearby = list(profile)
+                    for i in flips:
+                        nearby[i] = 1 - nearby[i]
+
+                    nearby = tuple(nearby)
+                    if nearby in self.buckets:
+                        yield nearby
+        else:
+            for occupied in self.buckets:
+                distance = sum([a != b for a, b in zip(profile, occupied)])
+                if distance <= radius:
+                    yield occupied
+
+    def similar_agents(self, agent, sim_thresh):
+        # Every agent (including `agent` itself) at least sim_thresh similar to
+        # `agent`, in agent list order
+        radius = self.max_distance(len(agent.beh), sim_thresh)
+
+        similar = []
+        for profile in self.profiles_within(tuple(agent.beh), radius):
+            similar.extend(self.buckets[profile].values())
+
+        similar.sort(key=lambda a: self.positions[a.id])
+
+        return similar
@@ -0,0 +1,405 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import time
+from itertools import chain, product
+
+import igraph as ig
+import numpy as np
+
+from simulation import Simulation
+
+# Benchmarks for the simulation hot paths. Every case in the grid is timed for
+# setup, whole ticks, each tick phase on its own, history recording, history
+# export, and the SQLite insert. Results are written as JSON, so runs from
+# different commits can be compared.
+#
+#   python benchmark.py                              # full grid
+#   python benchmark.py --n-agents 36 500 --ticks 3  # smaller grid
+#
+# With --recruitment-tradeoff, each case instead compares sampled recruitment
+# (for each --k) against exhaustive recruitment, for speed and fidelity. Sampled
+# recruitment is a different model rather than an approximation: exhaustive
+# recruitment adds every similar enough non-neighbor, so its networks are much
+# denser, and the density error is large for any small k.
+
+DEFAULT_GRID = {
+    "n_agents": [36, 500, 5000],
+    "p_edge": [0.05, 0.50],
+    "n_beh": [5, 10],
+}
+
+
+def benchmark_params(n_agents, p_edge, n_beh, ticks, seed):
+    # Middle-of-the-road values from the mock experiment, with the intervention
+    # active from tick 1 so its cost shows up in the tick timings
+    assert ticks >= 2
+
+    params = {
+        "ticks": ticks,
+        "n_agents": n_agents,
+        "n_beh": n_beh,
+        "sui_ORs": np.linspace(1, 3, n_beh).tolist(),
+        "baserates": [0.20] * n_beh,
+        "p_edge": p_edge,
+        "p_spon_change": 0.10,
+        "p_emul": 0.10,
+        "sim_thresh": 0.80,
+        "gen_sui_prev": 1 / 5000,
+        "gen_ave_beh": 2,
+        "intervention_params": [
+            {
+                "intv_class_name": "MockInterventionB",
+                "start_tick": 1,
+                "duration": ticks - 1,
+                "tar_severity": [0.66, 1],
+                "p_rewire": 0.05,
+                "p_enrolled": 0.20,
+                "p_beh_change": 0.75,
+            }
+        ],
+        "sample_num": 0,
+        "seed": seed,
+        "sim_id": 0,
+        "validation": "setup",
+        "metrics": True,
+    }
+
+    return params
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+
+    return time.perf_counter() - start
+
+
+def summarize(samples):
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "samples_s": samples,
+    }
+
+
+def emulate_phase(sim):
+    by_id = sim.agents_by_id()
+    for a in sim.agents:
+        a.emulate_alters(
+            agents=sim.agents, network=sim.network, p=sim.p_emul, by_id=by_id
+        )
+
+
+def prune_phase(sim):
+    by_id = sim.agents_by_id()
+    for a in sim.agents:
+        a.prune_alters(
+            agents=sim.agents,
+            network=sim.network,
+            sim_thresh=sim.sim_thresh,
+            by_id=by_id,
+        )
+
+
+def recruit_phase(sim):
+    by_id = sim.agents_by_id()
+    for a in sim.agents:
+        a.recruit_alters(
+            agents=sim.agents,
+            network=sim.network,
+            sim_thresh=sim.sim_thresh,
+            by_id=by_id,
+        )
+
+
+# Each phase of Simulation.tick, run over the whole population on its own
+PHASES = {
+    "interventions": lambda sim: [
+        intv.intervene(sim.agents, sim.network) for intv in sim.interventions
+    ],
+    "emulate": emulate_phase,
+    "prune": prune_phase,
+    "recruit": recruit_phase,
+    "spontaneous_change": lambda sim: [
+        a.spontaneously_change(
+            baserates=sim.baserates, susceptibility=sim.p_spon_change
+        )
+        for a in sim.agents
+    ],
+    "suicide": lambda sim: [
+        a.consider_suicide(
+            odds_ratios=sim.sui_ORs,
+            gen_sui_prev=sim.gen_sui_prev,
+            gen_ave_beh=sim.gen_ave_beh,
+            coefs=sim.config.risk_coefs,
+        )
+        for a in sim.agents
+    ],
+    "validate": lambda sim: sim.validate(),
+    "record_history": lambda sim: sim.record_history(),
+}
+
+
+def benchmark_case(n_agents, p_edge, n_beh, ticks=3, repeats=3, seed=1234567):
+    params = benchmark_params(n_agents, p_edge, n_beh, ticks, seed)
+
+    setup_samples = []
+    for _ in range(repeats):
+        random.seed(seed)
+        sim = Simulation(**params)
+        setup_samples.append(timed(sim.setup))
+
+    tick_samples = []
+    while sim.cur_tick < sim.total_ticks:
+        tick_samples.append(timed(sim.tick))
+
+    # Phases are timed on copies of the finished simulation, so every sample
+    # starts from the same state
+    phase_samples = {phase: [] for phase in PHASES}
+    for phase, run_phase in PHASES.items():
+        for _ in range(repeats):
+            sim_copy = copy.deepcopy(sim)
+            phase_samples[phase].append(timed(run_phase, sim_copy))
+
+    export_samples = []
+    insert_samples = []
+    for _ in range(repeats):
+        sim_copy = copy.deepcopy(sim)
+        export_samples.append(timed(sim_copy.history_for_db))
+
+        with sqlite3.connect(":memory:") as con:
+            sim_copy.create_history_tables(con)
+            insert_samples.append(timed(sim_copy.insert_history_to_db, con))
+
+    history_rows = {
+        aspect: sum(len(objs) for objs in sim.history[aspect]) for aspect in sim.history
+    }
+
+    result = {
+        "n_agents": n_agents,
+        "p_edge": p_edge,
+        "n_beh": n_beh,
+        "ticks": ticks,
+        "repeats": repeats,
+        "seed": seed,
+        "n_edges": sim.network.ecount(),
+        "history_rows": history_rows,
+        "setup": summarize(setup_samples),
+        "tick": summarize(tick_samples),
+        "tick_metrics": sim.metrics.as_dict(),
+        "phases": {phase: summarize(s) for phase, s in phase_samples.items()},
+        "history_for_db": summarize(export_samples),
+        "db_insert": summarize(insert_samples),
+    }
+
+    return result
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return rev.stdout.strip()
+
+
+def report_meta(grid):
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "igraph": ig.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "grid": grid,
+    }
+
+    return meta
+
+
+def write_report(report, out_path):
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=4)
+
+
+def run_benchmarks(grid, ticks=3, repeats=3, seed=1234567, out_path=None):
+    results = []
+    for n_agents, p_edge, n_beh in product(
+        grid["n_agents"], grid["p_edge"], grid["n_beh"]
+    ):
+        print(f"n_agents={n_agents} p_edge={p_edge} n_beh={n_beh}", flush=True)
+
+        result = benchmark_case(n_agents, p_edge, n_beh, ticks, repeats, seed)
+        results.append(result)
+
+        print(
+            f"\tsetup {result['setup']['median_s']:.4f}s"
+            f"\ttick {result['tick']['median_s']:.4f}s",
+            flush=True,
+        )
+
+    report = {"meta": report_meta(grid), "results": results}
+
+    if out_path is not None:
+        write_report(report, out_path)
+
+    return report
+
+
+def population_summary(sim):
+    # Population-level series averaged over the run: what a sweep would analyze
+    networks = [tick[0] for tick in sim.history["networks"]]
+    agents = list(chain.from_iterable(sim.history["agents"]))
+    beh_cols = [f"beh{i}" for i in range(sim.n_beh)]
+
+    summary = {
+        "density": np.mean([n["density"] for n in networks]),
+        "assort_sum_beh": np.nanmean([n["assort_sum_beh"] for n in networks]),
+        "prevalence": np.mean([[a[col] for col in beh_cols] for a in agents]),
+        "mean_risk": np.mean([a["cur_risk"] for a in agents]),
+    }
+
+    return {key: float(val) for key, val in summary.items()}
+
+
+def recruitment_run(params, recruitment, replicates, seed):
+    tick_samples = []
+    summaries = []
+    for replicate in range(replicates):
+        random.seed(seed + replicate)
+        params = dict(params, seed=seed + replicate)
+
+        sim = Simulation(recruitment=recruitment, **params)
+        sim.setup()
+        tick_samples.append(timed(sim.go) / sim.total_ticks)
+        summaries.append(population_summary(sim))
+
+    result = {
+        "recruitment": recruitment,
+        "recruit_k": params.get("recruit_k"),
+        "tick": summarize(tick_samples),
+        "summary": {
+            key: float(np.mean([s[key] for s in summaries])) for key in summaries[0]
+        },
+    }
+
+    return result
+
+
+def recruitment_tradeoff(
+    n_agents, p_edge, n_beh, ks, ticks=20, replicates=3, seed=1234567
+):
+    # Exhaustive recruitment (through the behavior index) against sampled
+    # recruitment with each k: time per tick, speedup, and the relative error
+    # of the population-level summaries
+    params = benchmark_params(n_agents, p_edge, n_beh, ticks, seed)
+    params["metrics"] = False
+
+    exhaustive = recruitment_run(params, "indexed", replicates, seed)
+
+    results = [exhaustive]
+    for k in ks:
+        sampled = recruitment_run(
+            dict(params, recruit_k=k), "sampled", replicates, seed
+        )
+
+        exhaustive_tick = exhaustive["tick"]["median_s"]
+        sampled["speedup"] = exhaustive_tick / sampled["tick"]["median_s"]
+        sampled["relative_error"] = {
+            key: abs(val - exhaustive["summary"][key])
+            / max(abs(exhaustive["summary"][key]), 1e-12)
+            for key, val in sampled["summary"].items()
+        }
+
+        results.append(sampled)
+
+    return {"n_agents": n_agents, "p_edge": p_edge, "n_beh": n_beh, "runs": results}
+
+
+def run_recruitment_tradeoff(
+    grid, ks, ticks=20, replicates=3, seed=1234567, out_path=None
+):
+    results = []
+    for n_agents, p_edge, n_beh in product(
+        grid["n_agents"], grid["p_edge"], grid["n_beh"]
+    ):
+        print(f"n_agents={n_agents} p_edge={p_edge} n_beh={n_beh}", flush=True)
+
+        result = recruitment_tradeoff(
+            n_agents, p_edge, n_beh, ks, ticks, replicates, seed
+        )
+        results.append(result)
+
+        for run in result["runs"][1:]:
+            print(
+                f"\tk={run['recruit_k']}\tspeedup {run['speedup']:.1f}x"
+                f"\tdensity error {run['relative_error']['density']:.3f}"
+                f"\tprevalence error {run['relative_error']['prevalence']:.3f}",
+                flush=True,
+            )
+
+    report = {"meta": report_meta(grid), "ks": ks, "results": results}
+
+    if out_path is not None:
+        write_report(report, out_path)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulation")
+    parser.add_argument("--n-agents", type=int, nargs="+")
+    parser.add_argument("--p-edge", type=float, nargs="+")
+    parser.add_argument("--n-beh", type=int, nargs="+")
+    parser.add_argument("--ticks", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234567)
+    parser.add_argument(
+        "--recruitment-tradeoff",
+        action="store_true",
+        help="compare sampled against exhaustive recruitment instead",
+    )
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    grid = {
+        "n_agents": args.n_agents or DEFAULT_GRID["n_agents"],
+        "p_edge": args.p_edge or DEFAULT_GRID["p_edge"],
+        "n_beh": args.n_beh or DEFAULT_GRID["n_beh"],
+    }
+
+    kind = "recruitment" if args.recruitment_tradeoff else "benchmark"
+    out_path = args.out or os.path.join(
+        "benchmarks", f"{kind}_{time.strftime('%Y-%m-%d_%H%M%S')}.json"
+    )
+
+    if args.recruitment_tradeoff:
+        run_recruitment_tradeoff(
+            grid, args.k, args.ticks, args.repeats, args.seed, out_path
+        )
+    else:
+        run_benchmarks(grid, args.ticks, args.repeats, args.seed, out_path)
+
+    print(f"results written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
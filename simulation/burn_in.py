@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import pickle
+import random
+
+from models import build_simulation
+
+# On-disk cache of burned-in simulation states.
+#
+# Up to the first intervention's start_tick, a run only depends on its network
+# and behavior parameters and its seed, not on its interventions. Runs that
+# share those (e.g. a sweep over p_enrolled, p_beh_change or p_rewire) can all
+# start from one burned-in state, which is stored under a hash of exactly the
+# parameters it depends on. The cache is shared by every process pointed at the
+# same directory, and the least recently used states are deleted once it holds
+# more than `max_bytes`.
+#
+# A seeded burn-in seeds `random` with the run's seed, and a cached one stores
+# the state of `random` with the simulation. Either way the caller gets the same
+# simulation and the same `random` state, whether the burn-in was taken from the
+# cache or not. An unseeded burn-in can't be reproduced: it is never cached, and
+# `random` is left as the caller has it.
+
+BURN_IN_CACHE_BYTES = 2 * 1024**3
+
+# Part of every key. Bump it whenever a change to the simulation code or to the
+# pickled state would make existing burn-ins stale or unreadable
+BURN_IN_FORMAT_VERSION = 1
+
+# Parameters that make no difference before the interventions start
+NOT_BURN_IN_PARAMS = [
+    "intervention_params",
+    "ticks",
+    "sim_id",
+    "sample_num",
+    "validation",
+    "validate_every",
+    "metrics",
+    "memory_ticks",
+    "workers",
+]
+
+
+def burn_in_ticks(params):
+    # Ticks before the first intervention starts
+    starts = [intv["start_tick"] for intv in params["intervention_params"]]
+
+    return min(starts + [params["ticks"]])
+
+
+def burn_in_key(params, ticks):
+    burn_in_params = {
+        key: val for key, val in params.items() if key not in NOT_BURN_IN_PARAMS
+    }
+    burn_in_params["burn_in_ticks"] = ticks
+    burn_in_params["burn_in_format_version"] = BURN_IN_FORMAT_VERSION
+
+    # numpy scalars from the parameter sampling are stored as python values
+    text = json.dumps(burn_in_params, sort_keys=True, default=lambda val: val.item())
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class BurnInCache:
+    def __init__(self, cache_dir, max_bytes=BURN_IN_CACHE_BYTES):
+        assert max_bytes > 0
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        # The cached entry, or None. Reading an entry marks it as recently used
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return entry
+
+    def put(self, key, entry):
+        # Written under a temporary name first, so other processes never see
+        # a partial entry
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        # Delete the least recently used entries until the cache fits
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_bytes = sum([size for _, size, _ in entries])
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
+def burned_in(params, ticks, cache=None):
+    # A simulation of `params`, set up and run for `ticks` ticks, which must not
+    # be past the start of its interventions (or up to that start, if
+    # convergence brings it forward). The burn-in is taken from the cache if it
+    # is there, and added to it if not
+    assert ticks <= burn_in_ticks(params)
+
+    sim = build_simulation(**params)
+
+    if params.get("seed") is None:
+        sim.setup()
+        sim.run_burn_in(ticks)
+        return sim
+
+    key = burn_in_key(params, ticks)
+    entry = cache.get(key) if cache is not None else None
+
+    if entry is None:
+        random.seed(params["seed"])
+        sim.setup()
+        sim.run_burn_in(ticks)
+
+        if cache is not None:
+            cache.put(key, {"state": sim.state(), "random": random.getstate()})
+    else:
+        sim.restore(entry["state"])
+        random.setstate(entry["random"])
+
+    return sim
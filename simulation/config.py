@@ -0,0 +1,102 @@
+import copy
+from collections.abc import Mapping
+
+from agent import Agent
+
+# The parameters of one simulation, kept apart from its state.
+#
+# A SimulationConfig is read-only: a run whose parameters change (a branch of a
+# fork, a start brought forward by convergence) gets a new one from replace().
+# That way the values derived from the parameters can be computed once and kept:
+# the suicide risk coefficients every agent needs every tick, and the flat
+# parameter row recorded in the history. Parameters are read as attributes or
+# as items.
+
+
+class SimulationConfig(Mapping):
+    # Parameter lists recorded as one column per item in the flat row
+    listlike_params = ["sui_ORs", "baserates"]
+    listlike_intv_params = ["tar_severity"]
+
+    def __init__(self, **params):
+        object.__setattr__(self, "_params", copy.deepcopy(params))
+        object.__setattr__(self, "_derived", {})
+
+    def __getitem__(self, key):
+        return self._params[key]
+
+    def __iter__(self):
+        return iter(self._params)
+
+    def __len__(self):
+        return len(self._params)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["_params"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, val):
+        raise AttributeError("SimulationConfig is read-only, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError("SimulationConfig is read-only, use replace()")
+
+    def __repr__(self):
+        return f"SimulationConfig({self._params!r})"
+
+    def replace(self, **changes):
+        return SimulationConfig(**dict(self._params, **changes))
+
+    def derived(self, name, compute):
+        # compute() once per config
+        if name not in self._derived:
+            self._derived[name] = compute()
+
+        return self._derived[name]
+
+    @property
+    def risk_coefs(self):
+        # (intercept, log odds ratios, adjustment) for Agent.suicide_risk()
+        return self.derived(
+            "risk_coefs",
+            lambda: Agent.risk_coefs(self.sui_ORs, self.gen_sui_prev, self.gen_ave_beh),
+        )
+
+    def row(self, flat=True):
+        # The parameters as recorded, with those of the first intervention
+        # alongside, and its start tick after any shift. A run without
+        # interventions (the control branch of a fork) has these columns, but
+        # NULL. A fresh dict, so the cached row can't be changed through it
+        row = self.derived(f"row_flat={flat}", lambda: self.build_row(flat))
+
+        return dict(row)
+
+    def build_row(self, flat):
+        # (the config's parameters are its own copy, and only these two dicts
+        # are changed below)
+        params = dict(self._params)
+
+        start_shift = params.pop("start_shift", 0)
+        without_interventions = params.pop("without_interventions", False)
+        intv_params = dict(params.pop("intervention_params")[0])
+
+        if flat:
+            for listlike in self.listlike_intv_params:
+                for i, item in enumerate(intv_params.pop(listlike)):
+                    intv_params.update({f"{listlike}{i}": item})
+
+            for listlike in self.listlike_params:
+                for i, item in enumerate(params.pop(listlike)):
+                    params.update({f"{listlike}{i}": item})
+
+        if without_interventions:
+            params.update(dict.fromkeys(intv_params))
+            params["effective_start_tick"] = None
+            return params
+
+        params.update(intv_params)
+        params["effective_start_tick"] = intv_params["start_tick"] - start_shift
+
+        return params
@@ -0,0 +1,44 @@
+from collections import deque
+
+import numpy as np
+
+# Online stationarity check for the burn-in.
+#
+# Every tick before the interventions start, the simulation hands over its
+# population-level aggregates (the prevalence of each behavior, the network's
+# density and its assortativity on the number of behaviors). The burn-in has
+# converged once, for every aggregate, the means over the last two stretches of
+# `window` ticks are no more than `tol` apart. The aggregates all lie in
+# [-1, 1], so one absolute tolerance fits all of them.
+
+
+class ConvergenceMonitor:
+    def __init__(self, window, tol=0.01):
+        assert window >= 1
+        assert tol > 0
+
+        self.window = window
+        self.tol = tol
+        self.recent = deque(maxlen=2 * window)
+        self.converged_tick = None
+
+    def observe(self, tick, aggregates):
+        # Aggregates after `tick` completed ticks. Returns whether the burn-in
+        # has converged (by now or earlier)
+        if self.converged_tick is not None:
+            return True
+
+        self.recent.append(aggregates)
+        if len(self.recent) < 2 * self.window:
+            return False
+
+        # Assortativity is undefined (nan) without variation to correlate,
+        # e.g. in a network without edges, which counts as no change
+        recent = np.nan_to_num(np.array(self.recent, dtype=float))
+        earlier = recent[: self.window].mean(axis=0)
+        later = recent[self.window :].mean(axis=0)
+
+        if (np.abs(later - earlier) <= self.tol).all():
+            self.converged_tick = tick
+
+        return self.converged_tick is not None
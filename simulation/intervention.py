@@ -1,6 +1,36 @@
 from math import ceil
-import random
-import igraph as ig
+import numpy as np
+
+
+def random_pairs(n, p, rng):
+    # Include each of the n * (n - 1) / 2 unordered pairs of range(n) with
+    # probability p, returned as an (m x 2) array of (i, j) with i < j. Unsampled
+    # pairs are jumped over with geometric skips, so the cost scales with the
+    # number of pairs drawn rather than with n ** 2
+    n_pairs = n * (n - 1) // 2
+    if (n_pairs == 0) or (p <= 0):
+        return np.empty((0, 2), dtype=int)
+
+    if p >= 1:
+        picks = np.arange(n_pairs)
+    else:
+        picks = []
+        last_pick = -1
+        batch_size = int(1.1 * p * n_pairs) + 16
+        while last_pick < n_pairs:
+            positions = last_pick + np.cumsum(rng.geometric(p, size=batch_size))
+            picks.append(positions[positions < n_pairs])
+            last_pick = positions[-1]
+        picks = np.concatenate(picks)
+
+    # Pairs are numbered column by column, pick = j * (j - 1) / 2 + i. Invert
+    # that, correcting for any floating point error in the square root
+    j = np.floor((1 + np.sqrt(1 + 8 * picks)) / 2).astype(int)
+    j -= j * (j - 1) // 2 > picks
+    j += (j + 1) * j // 2 <= picks
+    i = picks - j * (j - 1) // 2
+
+    return np.column_stack([i, j])
 
 
 class Intervention:
@@ -23,6 +53,7 @@ class Intervention:
         self.p_enrolled = p_enrolled
         self.p_beh_change = p_beh_change
         self.beh_changed = 0
+        self.rng = np.random.default_rng()
 
     def is_setup_phase(self, t):
         return t == self.start_tick
@@ -34,8 +65,61 @@ class Intervention:
         self.__dict__.update(kwargs)
         self.sui_ORs = sui_ORs
         self.enrolled_names = [a.name for a in agents]
+        self.enrolled_mask = self.enrollment_mask(agents)
+
+    def enroll(self, enrollees, agents):
+        self.enrolled_names = [a.name for a in enrollees]
+        self.enrolled_mask = self.enrollment_mask(agents)
+
+        for agent in enrollees:
+            agent.enrolled = True
+
+    def enrollment_mask(self, agents):
+        # Population arrays (the enrollment mask, the behavior matrix) have one
+        # row per agent, indexed by agent id. The simulation keeps agent ids
+        # equal to their vertex indices, so these rows also line up with
+        # network.vs
+        enrolled_names = set(self.enrolled_names)
+
+        mask = np.zeros(len(agents), dtype=bool)
+        for agent in agents:
+            mask[agent.id] = agent.name in enrolled_names
+
+        return mask
+
+    @staticmethod
+    def behavior_matrix(agents):
+        beh = np.empty((len(agents), len(agents[0].beh)), dtype=int)
+        for agent in agents:
+            beh[agent.id] = agent.beh
+
+        return beh
 
     def intervene(self, agents, network):
+
+        # List-based entry point. Gathers the population behavior matrix, lets
+        # intervene_masked() update it, and writes the enrolled rows back to
+        # their agents. Custom interventions may override this directly instead.
+        beh = self.behavior_matrix(agents)
+
+        self.intervene_masked(beh, self.enrolled_mask, network)
+
+        for agent in agents:
+            if self.enrolled_mask[agent.id]:
+                agent.beh = beh[agent.id].tolist()
+
+    def remove_random_edges(self, network, p):
+
+        # delete each edge with probability p, all in one batch
+        doomed_eids = np.flatnonzero(self.rng.random(network.ecount()) < p)
+        network.delete_edges(doomed_eids.tolist())
+
+        return network
+
+    def intervene_masked(self, beh, enrolled, network):
+        # Array-based entry point. `beh` is the (n_agents x n_beh) behavior
+        # matrix and `enrolled` a boolean mask over its rows. Only enrolled
+        # rows may be changed, and they are changed in place.
         pass
 
     def risk_factor_ranks(self, sui_ORs):
@@ -55,7 +139,9 @@ class Intervention:
     def enrolled_agents(self, agents):
         assert self.enrolled_names
 
-        return [a for a in agents if a.name in self.enrolled_names]
+        enrolled_names = set(self.enrolled_names)
+
+        return [a for a in agents if a.name in enrolled_names]
 
     def as_dict(self):
         d = {
@@ -75,56 +161,72 @@ class NetworkIntervention(Intervention):
         self.tar_beh = self.target_behaviors(self.sui_ORs, self.tar_severity)
 
         enrolled_agents = agents[0 : ceil(self.p_enrolled * len(agents))]
-        self.enrolled_names = [a.name for a in enrolled_agents]
-
-        for agent in enrolled_agents:
-            agent.enrolled = True
+        self.enroll(enrolled_agents, agents)
 
     def add_random_edges(self, network):
 
-        # generate a random graph for enrolled verts with edge density = p_rewire
-        n_verts = len(self.enrolled_names)
-        random_graph = ig.Graph.Erdos_Renyi(n=n_verts, p=self.p_rewire)
-        for i, vert in enumerate(random_graph.vs):
-            vert["name"] = self.enrolled_names[i]
+        # connect enrolled verts at random, with edge density = p_rewire (the
+        # enrollment mask's rows are vertex indices, see enrollment_mask)
+        enrolled_vids = np.flatnonzero(self.enrolled_mask)
+        pairs = enrolled_vids[random_pairs(len(enrolled_vids), self.p_rewire, self.rng)]
 
-        # add the edges from the random network to the existing network
-        random_edges = []
-        for edge in random_graph.es:
-            edge_tuple = (edge.source_vertex["name"], edge.target_vertex["name"])
-            random_edges.append(edge_tuple)
+        if len(pairs) == 0:
+            return network
 
-        network.add_edges(random_edges)
+        # skip pairs that are already connected, so no multiple edges are made
+        existing_eids = np.array(network.get_eids(pairs.tolist(), error=False))
+        random_edges = pairs[existing_eids < 0]
 
-        # remove any loops and multiple edges
-        network.simplify()
+        network.add_edges(random_edges.tolist())
 
         return network
 
-    def intervene(self, agents, network):
+    def intervene_masked(self, beh, enrolled, network):
         network = self.add_random_edges(network)
 
-        for agent in self.enrolled_agents(agents):
-            for i in self.tar_beh:
-                if random.random() < self.p_beh_change:
+        targets = np.ix_(np.flatnonzero(enrolled), np.array(self.tar_beh, dtype=int))
+        tar_beh = beh[targets]
+        changed = self.rng.random(tar_beh.shape) < self.p_beh_change
 
-                    # if this behavior was actually bad to start,
-                    # document the improvement
-                    self.beh_changed += int(agent.beh[i] == 1)
+        # if a changed behavior was actually bad to start, document the
+        # improvement
+        self.beh_changed += int(np.sum(tar_beh[changed] == 1))
 
-                    # change behavior for the better
-                    agent.beh[i] = 0
+        # change behavior for the better
+        tar_beh[changed] = 0
+        beh[targets] = tar_beh
 
 
 class IndividualIntervention(Intervention):
+    @staticmethod
+    def risk_scores(agents, sui_ORs):
+        beh = np.array([agent.beh for agent in agents], dtype=float)
+
+        return beh @ np.array(sui_ORs, dtype=float)
+
+    @staticmethod
+    def top_k_rows(scores, k):
+        # Rows holding the k largest scores, largest first. Ties are broken in
+        # favor of later rows, which is the order a reversed stable sort of the
+        # whole population would give
+        n = len(scores)
+        k = min(k, n)
+        if k <= 0:
+            return np.array([], dtype=int)
+
+        kth_score = scores[np.argpartition(scores, n - k)[n - k]]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[::-1][0 : k - len(above)]
+
+        rows = np.concatenate([above, tied])
+
+        return rows[np.lexsort((-rows, -scores[rows]))]
+
     def prioritize_agents(self, agents, sui_ORs, desc=True):
-        risk_scores = []
-        for agent in agents:
-            risk_score = sum([beh * risk for risk, beh in zip(sui_ORs, agent.beh)])
-            risk_scores.append(risk_score)
+        risk_scores = self.risk_scores(agents, sui_ORs)
 
-        sorted_pairs = sorted(zip(risk_scores, agents), key=lambda pair: pair[0])
-        ranked_agents = [agent for _, agent in sorted_pairs]
+        ranks = np.argsort(risk_scores, kind="stable")
+        ranked_agents = [agents[i] for i in ranks]
 
         if desc:
             ranked_agents = list(reversed(ranked_agents))
@@ -140,39 +242,54 @@ class IndividualIntervention(Intervention):
     def setup(self, agents, network, **kwargs):
         super().setup(agents, network, **kwargs)
 
+        self.risk_ranks = self.risk_factor_ranks(self.sui_ORs)
         self.treatable_beh = self.treatable_behaviors(self.sui_ORs, self.tar_severity)
 
         # Enroll the highest risk agents
-        ranked_agents = self.prioritize_agents(agents, self.sui_ORs)
-        enrolled_agents = ranked_agents[0 : ceil(self.p_enrolled * len(ranked_agents))]
-        self.enrolled_names = [a.name for a in enrolled_agents]
-
-        for agent in self.enrolled_agents(agents):
-            agent.enrolled = True
+        n_enrolled = ceil(self.p_enrolled * len(agents))
+        enrolled_rows = self.top_k_rows(
+            self.risk_scores(agents, self.sui_ORs), n_enrolled
+        )
+        enrolled_agents = [agents[i] for i in enrolled_rows]
+        self.enroll(enrolled_agents, agents)
 
     def priority_behaviors(self, agent):
-        risk_ranks = self.risk_factor_ranks(self.sui_ORs)
+        risk_ranks = getattr(self, "risk_ranks", None)
+        if risk_ranks is None:
+            risk_ranks = self.risk_factor_ranks(self.sui_ORs)
+
         active_risks = [i for i in risk_ranks if agent.beh[i] == 1]
         priority_beh = list(reversed(active_risks))
 
         return priority_beh
 
-    def intervene(self, agents, network):
-        enrollees = self.enrolled_agents(agents)
+    def treatable_mask(self, beh):
+        # For every row of beh, mark the (at most treatable_beh) active risk
+        # factors that priority_behaviors() would put first
+        priority_cols = np.array(self.risk_ranks[::-1], dtype=int)
 
-        for agent in enrollees:
-            priority_beh = self.priority_behaviors(agent)
-            treatable_beh = priority_beh[0 : self.treatable_beh]
+        active = beh[:, priority_cols] == 1
+        treatable = active & (np.cumsum(active, axis=1) <= self.treatable_beh)
+
+        mask = np.zeros(beh.shape, dtype=bool)
+        mask[:, priority_cols] = treatable
+
+        return mask
 
-            for i in treatable_beh:
-                if random.random() < self.p_beh_change:
+    def intervene_masked(self, beh, enrolled, network):
+        rows = np.flatnonzero(enrolled)
+        enrolled_beh = beh[rows]
 
-                    # if this behavior was actually bad to start,
-                    # document the improvement
-                    self.beh_changed += int(agent.beh[i] == 1)
+        treatable = self.treatable_mask(enrolled_beh)
+        changed = treatable & (self.rng.random(treatable.shape) < self.p_beh_change)
 
-                    # change the behavior to the better
-                    agent.beh[i] = 0
+        # treatable behaviors are all active risk factors, so every change
+        # is an improvement
+        self.beh_changed += int(changed.sum())
+
+        # change the behaviors to the better
+        enrolled_beh[changed] = 0
+        beh[rows] = enrolled_beh
 
 
 class MockInterventionA(Intervention):
@@ -181,26 +298,16 @@ class MockInterventionA(Intervention):
         self.tar_beh = self.target_behaviors(self.sui_ORs, self.tar_severity)
 
         enrolled_agents = agents[0 : ceil(self.p_enrolled * len(agents))]
-        self.enrolled_names = [a.name for a in enrolled_agents]
-
-        for agent in enrolled_agents:
-            agent.enrolled = True
+        self.enroll(enrolled_agents, agents)
 
-    def intervene(self, agents, network):
+    def intervene_masked(self, beh, enrolled, network):
 
         # Each enrollee has a chance to become completely risk free
-        enrollees = self.enrolled_agents(agents)
-
-        for agent in enrollees:
-            old_total = sum(agent.beh)
+        changed = enrolled & (self.rng.random(len(enrolled)) < self.p_beh_change)
 
-            if random.random() < self.p_beh_change:
-                # agent.beh = ([1] * 2) + ([0] * (len(agent.beh) - 2))
-                agent.beh = [0] * len(agent.beh)
+        self.beh_changed += int(beh[changed].sum())
 
-                random.shuffle(agent.beh)
-
-                self.beh_changed += old_total - sum(agent.beh)
+        beh[changed] = 0
 
 
 class MockInterventionB(Intervention):
@@ -209,28 +316,24 @@ class MockInterventionB(Intervention):
         self.tar_beh = self.target_behaviors(self.sui_ORs, self.tar_severity)
 
         enrolled_agents = agents[0 : ceil(self.p_enrolled * len(agents))]
-        self.enrolled_names = [a.name for a in enrolled_agents]
-
-        for agent in enrolled_agents:
-            agent.enrolled = True
+        self.enroll(enrolled_agents, agents)
 
-    def intervene(self, agents, network):
+    def intervene_masked(self, beh, enrolled, network):
 
         # Each enrollee has a chance for their risk to become the population
-        # average
-        enrollees = self.enrolled_agents(agents)
-
-        for agent in enrollees:
-            old_total = sum(agent.beh)
+        # average (2 risk factors, in random positions)
+        changed = np.flatnonzero(
+            enrolled & (self.rng.random(len(enrolled)) < self.p_beh_change)
+        )
 
-            if random.random() < self.p_beh_change:
-                agent.beh = ([1] * 2) + ([0] * (len(agent.beh) - 2))
+        old_total = beh[changed].sum()
 
-                random.shuffle(agent.beh)
+        n_risks = min(2, beh.shape[1])
+        risk_cols = self.rng.random((len(changed), beh.shape[1])).argsort(axis=1)
+        beh[changed] = 0
+        beh[changed[:, None], risk_cols[:, 0:n_risks]] = 1
 
-                self.beh_changed += old_total - sum(agent.beh)
+        self.beh_changed += int(old_total - beh[changed].sum())
 
         # ALSO There is a random chance edges will simply be deleted
-        for e in network.es:
-            if random.random() < self.p_rewire:
-                network.delete_edges(e.index)
+        self.remove_random_edges(network, p=self.p_rewire)
@@ -1,21 +1,54 @@
 import sqlite3
-from parameter_sampling import sample_parameter_space
-from simulation import Simulation
+from functools import partial
+from parameter_sampling import sample_arms, sample_parameter_space
+from models import build_simulation
+from burn_in import BURN_IN_CACHE_BYTES, BurnInCache, burn_in_ticks, burned_in
+from metrics import SimulationMetrics, simulation_record, write_metrics
+from profiling import prepare_profile_dir, profiled_run, merge_profiles
+from pipeline import ResultPipeline, unspill
+from summary import EnsembleSummary
+from scheduling import CostModel, schedule
 import multiprocessing as mp
 
 import time
 
+PARAM_FILE = "experiments/mock_input_params.json"
+METRICS_FILE = "experiments/mock_metrics.json"
 
-def run_simulation(sim_id):
+
+def run_simulation(
+    sim_id,
+    params=None,
+    metrics=False,
+    memory_ticks=None,
+    param_file=PARAM_FILE,
+    workers=1,
+    burn_in_cache=None,
+    recording="full",
+):
 
     print(f"starting {sim_id}")
 
-    param_file = "experiments/mock_input_params.json"
-    params = sample_parameter_space(param_file, n_samples=1)[0]
-    params.update({"sim_id": sim_id})
+    if params is None:
+        params = sample_parameter_space(param_file, n_samples=1)[0]
+
+    params = dict(params)
+    params.update(
+        {
+            "sim_id": sim_id,
+            "validation": "setup",
+            "metrics": metrics,
+            "memory_ticks": memory_ticks,
+            "workers": workers,
+            "recording": recording,
+        }
+    )
 
-    sim = Simulation(**params)
-    sim.setup()
+    if burn_in_cache is not None:
+        sim = burned_in(params, burn_in_ticks(params), burn_in_cache)
+    else:
+        sim = build_simulation(**params)
+        sim.setup()
     sim.go()
 
     print(f"returning {sim_id}")
@@ -23,48 +56,272 @@ def run_simulation(sim_id):
     return sim
 
 
-def simulation_to_db(queue, db_path):
-    with sqlite3.connect(db_path) as con:
+def run_branches(
+    sim_id,
+    params=None,
+    metrics=False,
+    memory_ticks=None,
+    param_file=PARAM_FILE,
+    workers=1,
+    burn_in_cache=None,
+    recording="full",
+):
+    # One simulation per intervention arm of the parameter file, plus one
+    # without interventions. They share the burn-in up to the earliest
+    # start_tick and use common random numbers after the fork. Branch i of
+    # simulation sim_id gets sim_id * n_arms + i, and records sim_id as trunk_id
+
+    print(f"starting {sim_id} (branched)")
+
+    if params is None:
+        params = sample_parameter_space(param_file, n_samples=1)[0]
+
+    params = dict(params)
+    params.update(
+        {
+            "sim_id": sim_id,
+            "validation": "setup",
+            "metrics": metrics,
+            "memory_ticks": memory_ticks,
+            "workers": workers,
+            "recording": recording,
+        }
+    )
+
+    arms = sample_arms(param_file)
+    fork_tick = min(
+        [intv["start_tick"] for arm in arms.values() if arm for intv in arm]
+    )
+
+    if burn_in_cache is not None:
+        trunk = burned_in(params, fork_tick, burn_in_cache)
+    else:
+        trunk = build_simulation(**params)
+        trunk.setup()
+        trunk.run_burn_in(fork_tick)
+
+    sim_ids = [sim_id * len(arms) + i for i in range(len(arms))]
+    branches = trunk.fork(arms, sim_ids=sim_ids)
+    for branch in branches:
+        branch.reseed()
+        branch.go()
+
+    print(f"returning {sim_id} (branched)")
+
+    return branches
+
 
-        # initialize database tables
-        example_sim = run_simulation(sim_id=-1)
-        example_sim.create_history_tables(con)
-        print("DB tables created (or detected)")
+def run_chunk(run, jobs):
+    # A batch of cheap (sim_id, params) jobs, run by one worker. A job is one
+    # simulation, or a list of them when branched
+    completed_sims = []
+    for sim_id, params in jobs:
+        completed = run(sim_id, params=params)
+        if isinstance(completed, list):
+            completed_sims.extend(completed)
+        else:
+            completed_sims.append(completed)
+
+    return completed_sims
+
+
+def simulation_to_db(queue, db_path, acks=None, summary_by=None, raw_history=True):
+    # With summary_by, the writer also keeps running summaries of the
+    # population-level series, grouped by those parameters (see summary.py).
+    # Without raw_history, it writes only these summaries
+    summary = EnsembleSummary(summary_by) if summary_by is not None else None
+
+    con = sqlite3.connect(db_path)
 
     while True:
-        completed_sim = queue.get()
+        message = queue.get()
 
-        if completed_sim is None:
+        if message is None:
             break
 
-        completed_sim.insert_history_to_db(con)
+        completed_sim, spilled = unspill(message)
+        if raw_history:
+            # tables are created from the results as they come in (a control
+            # branch has no interventions table, the branches after it do)
+            completed_sim.create_history_tables(con)
+            completed_sim.insert_history_to_db(con)
+        if summary is not None:
+            summary.add(completed_sim)
 
         print("\tdb entry completed", completed_sim.sim_id, flush=True)
 
+        if acks is not None:
+            acks.put((completed_sim.sim_id, spilled))
+
+    if summary is not None:
+        summary.insert_to_db(con)
+        print(f"summary of {summary.n_simulations} simulations written")
 
-def main():
+    con.close()
+
+    if acks is not None:
+        acks.put(None)
+
+
+def main(
+    n_simulations=1000,
+    processes=7,
+    metrics=False,
+    profile_dir=None,
+    profile_top=30,
+    memory_ticks=None,
+    queue_size=7,
+    spill_dir=None,
+    report_every=30.0,
+    cost_data=(METRICS_FILE,),
+    branched=False,
+    burn_in_dir=None,
+    burn_in_bytes=BURN_IN_CACHE_BYTES,
+    n_burn_ins=None,
+    recording="full",
+    summary_by=None,
+    raw_history=True,
+):
     print(time.ctime())
 
-    n_simulations = 1000
+    # with branching, every job forks into one simulation per arm
+    sims_per_job = len(sample_arms(PARAM_FILE)) if branched else 1
 
-    # initialize database entry queue and process
+    # sample every condition up front, so the most expensive ones (as predicted
+    # from earlier metrics or benchmark output) can be started first. With
+    # n_burn_ins, the conditions only differ in n_burn_ins network and behavior
+    # settings (and seeds), so a burn-in cache can share their burn-ins
+    conditions = sample_parameter_space(
+        PARAM_FILE, n_samples=n_simulations, n_burn_ins=n_burn_ins
+    )
+    burn_in_cache = None
+    if burn_in_dir is not None:
+        burn_in_cache = BurnInCache(burn_in_dir, max_bytes=burn_in_bytes)
+    cost_model = CostModel.from_files(cost_data)
+    costs = [cost_model.predict(condition) for condition in conditions]
+    chunks = schedule(costs, processes, max_chunk=queue_size)
+    print(
+        f"{len(chunks)} chunks scheduled, cost model fitted to "
+        f"{cost_model.n_observations} earlier simulations"
+    )
+
+    # initialize database entry queue and process. Simulations being run or
+    # waiting for the writer are bounded, and with a spill directory the ones
+    # the queue has no room for wait on disk instead
     db_path = "experiments/mock_results.db"
-    queue = mp.Queue()
-    db_process = mp.Process(target=simulation_to_db, args=(queue, db_path))
+    pipeline = ResultPipeline(
+        max_pending=sims_per_job * (processes + queue_size),
+        queue_size=queue_size,
+        spill_dir=spill_dir,
+        report_every=report_every,
+    )
+    db_process = mp.Process(
+        target=simulation_to_db,
+        args=(
+            pipeline.queue,
+            db_path,
+            pipeline.acks,
+            summary_by,
+            raw_history,
+        ),
+    )
     db_process.start()
+    pipeline.watch(db_process)
+
+    ensemble_metrics = SimulationMetrics(n_simulations=0)
+    simulation_records = []
+
+    # with recording="aggregate", simulations keep one row of population-level
+    # series per tick instead of every agent and edge. Each worker profiles its
+    # own simulations, if requested
+    run = partial(
+        run_branches if branched else run_simulation,
+        metrics=metrics,
+        memory_ticks=memory_ticks,
+        burn_in_cache=burn_in_cache,
+        recording=recording,
+    )
+    if profile_dir is not None:
+        prepare_profile_dir(profile_dir)
+        run = partial(profiled_run, run, profile_dir)
+
+    def completed(completed_sims):
+        # runs on the pool's result thread, one chunk at a time
+        for completed_sim in completed_sims:
+            if metrics:
+                ensemble_metrics.merge(completed_sim.metrics)
+                simulation_records.append(simulation_record(completed_sim))
+
+            pipeline.put(completed_sim)
 
     # run simulations and enter to DB asynchronously
-    with mp.Pool(processes=7) as pool:
-        for completed_sim in pool.imap_unordered(run_simulation, range(n_simulations)):
-            queue.put(completed_sim)
+    with mp.Pool(processes=processes) as pool:
+        for chunk in chunks:
+            jobs = [(sim_id, conditions[sim_id]) for sim_id in chunk]
+
+            pipeline.reserve(sims_per_job * len(chunk))
+            pool.apply_async(
+                run_chunk,
+                (run, jobs),
+                callback=completed,
+                error_callback=partial(
+                    pipeline.fail, n_slots=sims_per_job * len(chunk)
+                ),
+            )
+
+        pool.close()
+        pool.join()
+
+    if metrics:
+        write_metrics(METRICS_FILE, ensemble_metrics, simulation_records)
+        print(f"metrics written to {METRICS_FILE}")
+
+    if profile_dir is not None:
+        merge_profiles(profile_dir, "experiments/workers.prof", top_n=profile_top)
 
     # finalize and close database entry queue and process
-    queue.put(None)
+    pipeline.close()
+    pipeline.join()
 
     db_process.join()
     db_process.close()
 
-    queue.close()
+    if pipeline.errors:
+        raise pipeline.errors[0]
+
+    print(time.ctime())
+
+
+def flagship_main(param_file, n_simulations=1, workers=None, recording="full"):
+    # A few huge runs, one after another, each spread over every core by the
+    # synchronous model's shard workers (pool workers cannot have their own
+    # pools, so these runs are not sent to main()'s pool)
+    print(time.ctime())
+
+    workers = workers or mp.cpu_count()
+
+    # one simulation may wait for the writer while the next one runs
+    db_path = "experiments/flagship_results.db"
+    pipeline = ResultPipeline(max_pending=2, queue_size=1)
+    db_process = mp.Process(
+        target=simulation_to_db,
+        args=(pipeline.queue, db_path, pipeline.acks),
+    )
+    db_process.start()
+    pipeline.watch(db_process)
+
+    for sim_id in range(n_simulations):
+        pipeline.reserve()
+        sim = run_simulation(
+            sim_id, param_file=param_file, workers=workers, recording=recording
+        )
+        pipeline.put(sim)
+
+    pipeline.close()
+    pipeline.join()
+
+    db_process.join()
+    db_process.close()
 
     print(time.ctime())
 
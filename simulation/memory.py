@@ -0,0 +1,113 @@
+import os
+import sys
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+# Memory accounting for a running simulation. A report is one flat row: what
+# tracemalloc sees, the deep size of each kind of recorded history, the size of
+# the live agents and network, and the worker's peak RSS so far.
+
+# Traced allocations are attributed to these modules, everything else is "other"
+TRACED_MODULES = ["agent", "simulation", "intervention"]
+
+
+def slot_names(obj):
+    # Attributes kept in __slots__ rather than a __dict__ (e.g. Agent)
+    names = []
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", [])
+        names.extend([slots] if isinstance(slots, str) else slots)
+
+    return names
+
+
+def deep_sizeof(obj, seen=None):
+    # Size of obj and everything reachable from it, counting shared objects once
+    if seen is None:
+        seen = set()
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        for key, val in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(val, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(obj.__dict__, seen)
+    else:
+        for slot in slot_names(obj):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+
+    return size
+
+
+def network_sizeof(network):
+    # igraph keeps its edge list outside of Python's allocator: four integer
+    # vectors with one entry per edge (from, to and two sort indices) and two
+    # with one entry per vertex (index offsets), 8 bytes per entry
+    n_vectors = 4 * network.ecount() + 2 * (network.vcount() + 1)
+    attributes = [network.vs[attr] for attr in network.vs.attributes()]
+    attributes += [network.es[attr] for attr in network.es.attributes()]
+
+    return 8 * n_vectors + deep_sizeof(attributes)
+
+
+def peak_rss():
+    # In bytes. ru_maxrss is in kilobytes on Linux and bytes on macOS
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss
+
+    return maxrss * 1024
+
+
+def traced_by_module():
+    traced = {f"traced_{module}": 0 for module in TRACED_MODULES + ["other"]}
+    if not tracemalloc.is_tracing():
+        return traced
+
+    snapshot = tracemalloc.take_snapshot()
+    for stat in snapshot.statistics("filename"):
+        filename = stat.traceback[0].filename
+        module = os.path.splitext(os.path.basename(filename))[0]
+        if module not in TRACED_MODULES:
+            module = "other"
+        traced[f"traced_{module}"] += stat.size
+
+    return traced
+
+
+def memory_report(sim):
+    report = {"pid": os.getpid()}
+
+    current, peak = tracemalloc.get_traced_memory()
+    report.update({"traced_current": current, "traced_peak": peak})
+    report.update(traced_by_module())
+
+    for aspect in sim.history:
+        report.update({f"history_{aspect}": deep_sizeof(sim.history[aspect])})
+
+    report.update(
+        {
+            "live_agents": deep_sizeof(sim.agents),
+            "live_network": network_sizeof(sim.network),
+            "peak_rss": peak_rss(),
+        }
+    )
+
+    return report
@@ -0,0 +1,109 @@
+import json
+from time import perf_counter
+
+# Phases of Simulation.tick, in the order they run
+PHASES = [
+    "interventions",
+    "emulate",
+    "prune",
+    "recruit",
+    "spontaneous_change",
+    "suicide",
+    "validate",
+    "record_history",
+]
+
+COUNTERS = [
+    "similarity_evals",
+    "edges_added",
+    "edges_removed",
+    "alter_lookups",
+]
+
+
+class SimulationMetrics:
+    def __init__(self, n_simulations=1):
+        self.n_simulations = n_simulations
+        self.ticks = 0
+        self.setup_time = 0.0
+        self.tick_time = 0.0
+        self.phase_times = {phase: 0.0 for phase in PHASES}
+        self.counts = {counter: 0 for counter in COUNTERS}
+        self.last_lap = None
+
+    def start_lap(self):
+        self.last_lap = perf_counter()
+
+    def lap(self, phase):
+        # Charge the time since the previous lap to `phase`
+        now = perf_counter()
+        self.phase_times[phase] += now - self.last_lap
+        self.last_lap = now
+
+    def split_lap(self, shares):
+        # Charge the time since the previous lap to several phases, in
+        # proportion to `shares` (e.g. the time each phase took summed over
+        # parallel workers)
+        now = perf_counter()
+        total = sum(shares.values())
+        for phase, share in shares.items():
+            fraction = share / total if total > 0 else 1 / len(shares)
+            self.phase_times[phase] += fraction * (now - self.last_lap)
+        self.last_lap = now
+
+    def count(self, counter, n=1):
+        self.counts[counter] += n
+
+    def count_agent_update(self, agent):
+        # One agent's prune / recruit, read back from the counters the agent
+        # keeps anyway
+        self.counts["edges_removed"] += agent.pruned_alters
+        self.counts["edges_added"] += agent.recruited_alters
+
+    def merge(self, other):
+        self.n_simulations += other.n_simulations
+        self.ticks += other.ticks
+        self.setup_time += other.setup_time
+        self.tick_time += other.tick_time
+
+        for phase, seconds in other.phase_times.items():
+            self.phase_times[phase] += seconds
+
+        for counter, n in other.counts.items():
+            self.counts[counter] += n
+
+        return self
+
+    def as_dict(self):
+        d = {
+            "n_simulations": self.n_simulations,
+            "ticks": self.ticks,
+            "setup_time": self.setup_time,
+            "tick_time": self.tick_time,
+        }
+
+        for phase, seconds in self.phase_times.items():
+            d.update({f"{phase}_time": seconds})
+
+        d.update(self.counts)
+
+        return d
+
+
+def simulation_record(sim):
+    # One simulation's parameters next to its metrics, for cost modelling
+    record = sim.params_to_dict()[0]
+    record.update(sim.metrics.as_dict())
+
+    return record
+
+
+def write_metrics(path, ensemble_metrics, simulation_records):
+    report = {
+        "ensemble": ensemble_metrics.as_dict(),
+        "simulations": simulation_records,
+    }
+
+    with open(path, "w") as f:
+        # sampled parameters can be numpy scalars
+        json.dump(report, f, indent=4, default=lambda x: x.item())
@@ -0,0 +1,23 @@
+from simulation import Simulation
+from synchronous import SynchronousSimulation
+
+# Model variants, selected with the "model" entry of a parameter file:
+#   "sequential"  - agents update one at a time, in random order, each seeing
+#                   the changes made before it (Simulation)
+#   "synchronous" - every agent decides from the state at the start of the
+#                   tick and the changes are applied together, in array
+#                   operations (SynchronousSimulation)
+MODELS = {"sequential": Simulation, "synchronous": SynchronousSimulation}
+
+
+def build_simulation(model="sequential", workers=1, **params):
+    # The model is kept as a parameter, so it is recorded with the others.
+    # Only the synchronous model can spread one simulation over `workers`
+    # processes
+    assert model in MODELS
+    assert (workers == 1) or (model == "synchronous")
+
+    if model == "synchronous":
+        params["workers"] = workers
+
+    return MODELS[model](model=model, **params)
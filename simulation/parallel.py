@@ -0,0 +1,81 @@
+import multiprocessing as mp
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Process pool for the shards of a single simulation. The population arrays
+# every shard reads (behaviors, adjacency) are copied into shared memory once
+# per call, instead of being pickled for every task. Results, which are small
+# and shard-sized, come back the usual way.
+
+# Shared memory blocks this worker has attached to, by name
+attached_blocks = {}
+
+
+def attach(specs):
+    # Open the arrays described by `specs` (key -> (block name, shape, dtype))
+    # and let go of blocks from earlier calls that are no longer in use
+    names = {name for name, _, _ in specs.values()}
+    for name in list(attached_blocks):
+        if name not in names:
+            attached_blocks.pop(name).close()
+
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        if name not in attached_blocks:
+            # Pool workers share the parent's resource tracker, so the block
+            # is cleaned up once, when the parent unlinks it
+            attached_blocks[name] = shared_memory.SharedMemory(name=name)
+
+        arrays[key] = np.ndarray(shape, dtype, buffer=attached_blocks[name].buf)
+
+    return arrays
+
+
+def run_shard(kernel, specs, params, shard):
+    return kernel(attach(specs), params, *shard)
+
+
+class ShardPool:
+    def __init__(self, processes):
+        # Start the resource tracker before the workers, so they share it
+        resource_tracker.ensure_running()
+
+        self.pool = mp.Pool(processes=processes)
+        self.blocks = {}  # key -> shared memory block, reused while big enough
+
+    def share(self, arrays):
+        specs = {}
+        for key, array in arrays.items():
+            block = self.blocks.get(key)
+            if (block is None) or (block.size < array.nbytes):
+                if block is not None:
+                    block.close()
+                    block.unlink()
+
+                # room to grow, so the block is not replaced every tick
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(int(1.5 * array.nbytes), 1)
+                )
+                self.blocks[key] = block
+
+            shared = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            shared[...] = array
+            specs[key] = (block.name, array.shape, array.dtype.str)
+
+        return specs
+
+    def map(self, kernel, arrays, params, shards):
+        # kernel(arrays, params, *shard) for every shard, in order
+        specs = self.share(arrays)
+        tasks = [(kernel, specs, params, shard) for shard in shards]
+
+        return self.pool.starmap(run_shard, tasks, chunksize=1)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
@@ -1,3 +1,4 @@
+import copy
 import numpy
 import json
 from itertools import repeat
@@ -29,7 +30,7 @@ def random_parameters(input_params):
     return randomized_params
 
 
-def sample_parameter_space(input_json, n_samples):
+def sample_parameter_space(input_json, n_samples, n_burn_ins=None):
     with open(input_json, "r") as f:
         input_params = json.load(f)
 
@@ -39,4 +40,30 @@ def sample_parameter_space(input_json, n_samples):
         seed = round(numpy.random.default_rng().uniform(low=1e6, high=1e7))
         condition.update({"sample_num": i, "seed": seed})
 
+    # Optionally, only n_burn_ins different settings of everything but the
+    # interventions: sample i shares them (and its seed) with sample
+    # i % n_burn_ins, and only has its own intervention parameters
+    if n_burn_ins is not None:
+        assert n_burn_ins >= 1
+
+        for i, condition in enumerate(exp_conditions):
+            intervention_params = condition["intervention_params"]
+            condition.update(copy.deepcopy(exp_conditions[i % n_burn_ins]))
+            condition.update(
+                {"sample_num": i, "intervention_params": intervention_params}
+            )
+
     return exp_conditions
+
+
+def sample_arms(input_json):
+    # Every intervention in a parameter file as an arm of its own, with its
+    # parameters randomized, plus a "control" arm without interventions
+    with open(input_json, "r") as f:
+        input_params = json.load(f)
+
+    arms = {"control": None}
+    for intervention in input_params["intervention_params"]:
+        arms[intervention["intv_class_name"]] = [random_parameters(intervention)]
+
+    return arms
@@ -0,0 +1,207 @@
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import threading
+import time
+from collections import deque
+
+# Bounded hand-off between the simulation pool and the DB writer process.
+#
+# At most `max_pending` simulations are submitted but not yet written: the
+# parent waits for a free slot before submitting the next one, so workers pause
+# when the writer lags. Completed simulations wait for the writer in a queue of
+# `queue_size`. With a spill directory, a completed simulation that finds the
+# queue full is pickled to disk instead, its slot is freed, and its path is
+# queued once there is room.
+#
+# The writer acknowledges every simulation it has written, which frees slots
+# and drives a periodic report of queue depth and writer throughput.
+#
+# Once told which process is the writer (watch), every wait on the writer gives
+# up with an error if that process has exited before finishing, instead of
+# waiting for acknowledgements that will never come.
+
+# Seconds between checks on the writer while waiting on it
+WRITER_POLL = 1.0
+
+
+def spill(sim, spill_dir):
+    path = os.path.join(spill_dir, f"sim_{sim.sim_id}.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(sim, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return path
+
+
+def unspill(message):
+    # A queued message is either a simulation or the path of a spilled one
+    if not isinstance(message, str):
+        return message, False
+
+    with open(message, "rb") as f:
+        sim = pickle.load(f)
+    os.remove(message)
+
+    return sim, True
+
+
+class ResultPipeline:
+    def __init__(self, max_pending, queue_size, spill_dir=None, report_every=30.0):
+        assert queue_size >= 1
+        assert max_pending >= 1
+
+        self.queue = mp.Queue(maxsize=queue_size)  # writer's input
+        self.acks = mp.Queue()  # (sim_id, spilled) per write, None at the end
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.spill_dir = spill_dir
+        self.report_every = report_every
+        self.writer = None
+
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        # Shared by the pool's result thread and the acknowledgement thread
+        self.lock = threading.Lock()
+        self.spilled = deque()  # paths not yet queued
+        self.enqueued = 0
+        self.n_spilled = 0
+        self.written = 0
+        self.errors = []
+
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.ack_thread = threading.Thread(target=self.receive_acks, daemon=True)
+        self.ack_thread.start()
+
+    def watch(self, writer):
+        # The writer's process, checked on while waiting for it
+        self.writer = writer
+
+        return self
+
+    def check_writer(self):
+        # Raise if the writer has exited without being told to finish. Whatever
+        # is still buffered for it is abandoned, so this process can exit
+        if (self.writer is not None) and (not self.writer.is_alive()):
+            self.queue.cancel_join_thread()
+            raise RuntimeError(
+                f"DB writer exited early, with exit code {self.writer.exitcode}"
+            )
+
+    def queue_put(self, message):
+        # Blocks while the queue is full and the writer is alive
+        while True:
+            try:
+                return self.queue.put(message, timeout=WRITER_POLL)
+            except queue.Full:
+                self.check_writer()
+
+    def reserve(self, n_slots=1):
+        # Wait until n_slots more simulations may be submitted
+        self.check_writer()
+        for _ in range(n_slots):
+            while not self.slots.acquire(timeout=WRITER_POLL):
+                self.check_writer()
+
+    def put(self, sim):
+        # A completed simulation, from the pool's result thread. Without a spill
+        # directory this blocks while the queue is full. A simulation the writer
+        # has died before taking is dropped (its slot freed), and the error is
+        # raised by the next wait on the writer
+        if self.spill_dir is None:
+            try:
+                self.queue_put(sim)
+            except RuntimeError as error:
+                self.fail(error)
+                return None
+
+            with self.lock:
+                self.enqueued += 1
+            return None
+
+        with self.lock:
+            self.flush()
+            try:
+                self.queue.put_nowait(sim)
+                self.enqueued += 1
+            except queue.Full:
+                self.spilled.append(spill(sim, self.spill_dir))
+                self.n_spilled += 1
+                self.slots.release()
+
+    def fail(self, error, n_slots=1):
+        # A job of n_slots simulations raised. Keep its slots from being lost
+        with self.lock:
+            self.errors.append(error)
+        for _ in range(n_slots):
+            self.slots.release()
+
+    def flush(self):
+        # Queue spilled paths while there is room (lock held)
+        while self.spilled:
+            try:
+                self.queue.put_nowait(self.spilled[0])
+            except queue.Full:
+                break
+            self.spilled.popleft()
+            self.enqueued += 1
+
+    def receive_acks(self):
+        while True:
+            ack = self.acks.get()
+            if ack is None:
+                break
+
+            sim_id, was_spilled = ack
+            if not was_spilled:
+                self.slots.release()
+
+            with self.lock:
+                self.written += 1
+                self.flush()
+
+            if time.perf_counter() - self.last_report >= self.report_every:
+                self.report()
+
+    def report(self):
+        now = time.perf_counter()
+        with self.lock:
+            depth = self.enqueued - self.written
+            on_disk = len(self.spilled)
+            written = self.written
+            n_spilled = self.n_spilled
+        self.last_report = now
+
+        throughput = written / max(now - self.started, 1e-9)
+        print(
+            f"\tqueue depth {depth}, waiting on disk {on_disk}, "
+            f"spilled {n_spilled}, written {written} ({throughput:.2f} sims/s)",
+            flush=True,
+        )
+
+    def close(self):
+        # Once every simulation has been put: queue whatever is still on disk
+        # and tell the writer to finish
+        with self.lock:
+            remaining = list(self.spilled)
+            self.spilled.clear()
+            self.enqueued += len(remaining)
+
+        for path in remaining:
+            self.queue_put(path)
+        self.queue_put(None)
+
+    def join(self):
+        # Wait until the writer has acknowledged its last simulation. Once it
+        # has exited, its last acknowledgement is already on its way
+        while self.ack_thread.is_alive():
+            exited = (self.writer is not None) and (not self.writer.is_alive())
+            self.ack_thread.join(timeout=WRITER_POLL)
+            if exited and self.ack_thread.is_alive():
+                self.check_writer()
+
+        self.report()
+
+        self.queue.close()
+        self.acks.close()
@@ -0,0 +1,63 @@
+import argparse
+import cProfile
+import os
+import pstats
+from glob import glob
+
+# Profiling for the ensemble runner. Each pool worker profiles the simulations
+# it runs and dumps one stats file per simulation; the parent merges them into
+# a single pstats dump once the pool is done.
+
+
+def prepare_profile_dir(profile_dir):
+    # Start from an empty directory, so stale runs are not merged in
+    os.makedirs(profile_dir, exist_ok=True)
+    for path in glob(os.path.join(profile_dir, "*.prof")):
+        os.remove(path)
+
+
+def profiled_run(run, profile_dir, sim_id, **kwargs):
+    profiler = cProfile.Profile()
+    sim = profiler.runcall(run, sim_id, **kwargs)
+
+    prof_path = os.path.join(profile_dir, f"sim_{sim_id}_pid_{os.getpid()}.prof")
+    profiler.dump_stats(prof_path)
+
+    return sim
+
+
+def merge_profiles(profile_dir, out_path, top_n=30, sort_by=pstats.SortKey.TIME):
+    prof_paths = sorted(glob(os.path.join(profile_dir, "*.prof")))
+    if not prof_paths:
+        return None
+
+    stats = pstats.Stats(*prof_paths)
+    stats.dump_stats(out_path)
+
+    print(f"merged {len(prof_paths)} worker profiles into {out_path}")
+    stats.sort_stats(sort_by)
+    stats.print_stats(top_n)
+
+    return stats
+
+
+def profile_main():
+    from main import main
+
+    parser = argparse.ArgumentParser(description="Profile the ensemble runner")
+    parser.add_argument("--n-simulations", type=int, default=28)
+    parser.add_argument("--processes", type=int, default=7)
+    parser.add_argument("--profile-dir", default="experiments/profiles")
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+
+    main(
+        n_simulations=args.n_simulations,
+        processes=args.processes,
+        profile_dir=args.profile_dir,
+        profile_top=args.top,
+    )
+
+
+if __name__ == "__main__":
+    profile_main()
@@ -0,0 +1,135 @@
+import json
+import os
+from math import log
+
+import numpy as np
+
+# Cost-aware scheduling for the ensemble runner. The cost of a simulation is
+# predicted from its sampled parameters with a log-linear model of the time per
+# tick,
+#
+#   log(tick_time) = b0 + b1 log(n_agents) + b2 log(p_edge) + b3 log(n_beh)
+#                    + b4 sim_thresh
+#
+# fitted to earlier metrics output (main(metrics=True)) or benchmark output
+# (benchmark.py). Jobs are then handed out most expensive first, with cheap
+# jobs batched into chunks of similar predicted cost.
+
+# Without any data: a tick costs about as much as comparing every pair of agents
+DEFAULT_COEFS = [0.0, 2.0, 1.0, 1.0, 0.0]
+
+# Benchmarks do not vary the similarity threshold
+BENCHMARK_SIM_THRESH = 0.80
+
+
+def cost_features(n_agents, p_edge, n_beh, sim_thresh):
+    return [
+        1.0,
+        log(max(n_agents, 1)),
+        log(max(p_edge, 1e-6)),
+        log(max(n_beh, 1)),
+        sim_thresh,
+    ]
+
+
+def metrics_observations(report):
+    # (features, seconds per tick) from write_metrics() output
+    observations = []
+    for record in report["simulations"]:
+        if record["ticks"] > 0:
+            features = cost_features(
+                record["n_agents"],
+                record["p_edge"],
+                record["n_beh"],
+                record["sim_thresh"],
+            )
+            observations.append((features, record["tick_time"] / record["ticks"]))
+
+    return observations
+
+
+def benchmark_observations(report):
+    # (features, seconds per tick) from benchmark.py output
+    observations = []
+    for result in report["results"]:
+        features = cost_features(
+            result["n_agents"], result["p_edge"], result["n_beh"], BENCHMARK_SIM_THRESH
+        )
+        observations.append((features, result["tick"]["median_s"]))
+
+    return observations
+
+
+class CostModel:
+    def __init__(self, coefs=None, n_observations=0):
+        self.coefs = np.array(DEFAULT_COEFS if coefs is None else coefs, dtype=float)
+        self.n_observations = n_observations
+
+    @classmethod
+    def fit(cls, observations):
+        # Least squares on log seconds per tick. Parameters that did not vary
+        # in the data get no weight (minimum norm solution)
+        observations = [(x, y) for x, y in observations if y > 0]
+        if not observations:
+            return cls()
+
+        X = np.array([x for x, _ in observations])
+        y = np.log([y for _, y in observations])
+        coefs = np.linalg.lstsq(X, y, rcond=None)[0]
+
+        return cls(coefs, n_observations=len(observations))
+
+    @classmethod
+    def from_files(cls, paths):
+        # Fit to every metrics or benchmark report in paths that exists
+        observations = []
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+
+            with open(path, "r") as f:
+                report = json.load(f)
+
+            if "simulations" in report:
+                observations += metrics_observations(report)
+            else:
+                observations += benchmark_observations(report)
+
+        return cls.fit(observations)
+
+    def tick_cost(self, params):
+        features = cost_features(
+            params["n_agents"], params["p_edge"], params["n_beh"], params["sim_thresh"]
+        )
+
+        return float(np.exp(self.coefs @ features))
+
+    def predict(self, params):
+        # Predicted seconds for a whole run
+        return params["ticks"] * self.tick_cost(params)
+
+
+def schedule(costs, processes, chunks_per_process=4, max_chunk=None):
+    # Job indices grouped into chunks, most expensive first. Jobs are added to
+    # a chunk until it costs about 1 / (processes * chunks_per_process) of the
+    # total, so expensive jobs run alone and start early, while cheap ones are
+    # handed out in batches at the end
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+    target = sum(costs) / (processes * chunks_per_process)
+
+    chunks = []
+    chunk = []
+    chunk_cost = 0
+    for i in order:
+        chunk.append(i)
+        chunk_cost += costs[i]
+
+        if (chunk_cost >= target) or (len(chunk) == max_chunk):
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
@@ -1,35 +1,159 @@
 import copy
 import json
 import random
+import tracemalloc
 import igraph as ig
+import numpy as np
 
-from itertools import chain
+from time import perf_counter
 
 from intervention import (
+    Intervention,
     NetworkIntervention,
     IndividualIntervention,
     MockInterventionA,
     MockInterventionB,
 )
 from agent import Agent
+from behavior_index import BehaviorIndex
+from config import SimulationConfig
+from convergence import ConvergenceMonitor
+from metrics import SimulationMetrics
+from memory import memory_report
+
+# How often Simulation.validate() runs:
+#   "off"      - never
+#   "setup"    - once, at the end of setup()
+#   "periodic" - at setup and after every `validate_every` ticks
+#   "paranoid" - at setup, before and after every tick, and around go()
+VALIDATION_LEVELS = ["off", "setup", "periodic", "paranoid"]
+
+# How agents find new alters to recruit:
+#   "scan"    - compare against every agent in the population
+#   "indexed" - compare only against agents in nearby behavior profiles, found
+#               through a BehaviorIndex. Gives exactly the same results as "scan"
+#   "sampled" - compare only against `recruit_k` randomly drawn non-neighbors
+#               each tick. Changes the model, so recruit_k is a model parameter:
+#               the agents' updates take O(n * (k + degree)) per tick, but the
+#               network stays far sparser than with exhaustive recruitment (see
+#               benchmark.py --recruitment-tradeoff)
+RECRUITMENT_MODES = ["scan", "indexed", "sampled"]
+
+# What record_history() keeps, as the history aspects written to the database:
+#   "full"      - every agent and edge on every tick, plus the network, outcome
+#                 and intervention rows
+#   "aggregate" - only population-level series, as one "aggregates" row per
+#                 tick (behavior prevalences, attempts, risk, density and
+#                 assortativities), plus the intervention rows
+HISTORY_ASPECTS = {
+    "full": ["agents", "edges", "networks", "interventions", "parameters", "outcomes"],
+    "aggregate": ["aggregates", "interventions", "parameters"],
+}
+
+
+def columns_to_rows(columns):
+    # {column: array} to one dict per row, with python values
+    columns = {key: col.tolist() for key, col in columns.items()}
+
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
 
 
 class Simulation:
-    def __init__(self, ticks, **kwargs):
+    # Everything a run builds up tick by tick, as opposed to its parameters
+    state_attrs = [
+        "cur_tick",
+        "network",
+        "agents",
+        "beh_index",
+        "rng",
+        "intervention_rng",
+        "history",
+        "convergence",
+    ]
+
+    def __init__(
+        self,
+        ticks,
+        validation="paranoid",
+        validate_every=1,
+        metrics=False,
+        memory_ticks=None,
+        recruitment="scan",
+        recording="full",
+        converge_window=None,
+        converge_tol=0.01,
+        converge_margin=None,
+        **kwargs,
+    ):
+        assert validation in VALIDATION_LEVELS
+        assert validate_every >= 1
+        assert recruitment in RECRUITMENT_MODES
+        assert recording in HISTORY_ASPECTS
+        assert (recruitment != "sampled") or (kwargs.get("recruit_k", 0) >= 1)
+
+        # With a converge_window, the interventions (and the end of the run)
+        # are brought forward by start_shift ticks, to converge_margin ticks
+        # after the burn-in has converged. These settings change the model, so
+        # they are recorded with the parameters when given
+        params = dict(kwargs, total_ticks=ticks, start_shift=0)
+        self.convergence = None
+        if converge_window is not None:
+            params["converge_window"] = converge_window
+            params["converge_tol"] = converge_tol
+            params["converge_margin"] = (
+                converge_window if converge_margin is None else converge_margin
+            )
+            self.convergence = ConvergenceMonitor(converge_window, converge_tol)
+
+        # The parameters, read as attributes of the simulation (see __getattr__)
+        self.config = SimulationConfig(**params)
 
-        self.__dict__.update(kwargs)
-        self.total_ticks = ticks
         self.cur_tick = 0
-        self.history = {
-            "agents": [],
-            "edges": [],
-            "vertices": [],
-            "networks": [],
-            "interventions": [],
-            "parameters": [],
-        }
+        self.validation = validation
+        self.validate_every = validate_every
+        self.recruitment = recruitment
+        self.recording = recording
+
+        # Per-phase timings and operation counts, only collected on request
+        self.metrics = SimulationMetrics() if metrics else None
+
+        # Memory reports, taken once the number of completed ticks is listed in
+        # memory_ticks (0 is the end of setup), matching the ticks in history
+        self.memory_ticks = list(memory_ticks) if memory_ticks else []
+        self.memory_reports = []
+        self.started_tracing = False
+        self.history = {aspect: [] for aspect in HISTORY_ASPECTS[recording]}
+
+    def __getattr__(self, name):
+        # Only called for names that are not attributes: the parameters
+        config = self.__dict__.get("config")
+        if config is None or name not in config:
+            raise AttributeError(name)
+
+        return config[name]
+
+    def __setattr__(self, name, val):
+        config = self.__dict__.get("config")
+        if config is not None and name in config:
+            raise AttributeError(f"{name} is a parameter, replace the config instead")
+
+        super().__setattr__(name, val)
 
     def setup(self):
+        if self.metrics is not None:
+            setup_start = perf_counter()
+
+        if self.memory_ticks and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+        # Random number generators for array-based updates: one for the agents
+        # and one for the interventions, so that branches with and without an
+        # intervention (see fork) draw the same numbers for their agents
+        seed_seq = np.random.SeedSequence(getattr(self, "seed", None))
+        self.rng, self.intervention_rng = [
+            np.random.default_rng(s) for s in seed_seq.spawn(2)
+        ]
 
         # Network
         self.network = ig.Graph.Erdos_Renyi(
@@ -46,74 +170,357 @@ class Simulation:
 
             self.agents.append(agent)
 
+        if self.recruitment == "indexed":
+            self.beh_index = BehaviorIndex(self.agents)
+        else:
+            self.beh_index = None
+
         # Interventions
-        self.interventions = []
-        for intv_params in self.intervention_params:
-            intv_class = globals()[intv_params["intv_class_name"]]
-            intv = intv_class(**intv_params)
-            self.interventions.append(intv)
+        self.interventions = self.build_interventions(self.intervention_params)
 
-        self.validate()
+        if self.validation_due("setup"):
+            self.validate()
 
         self.record_history()
+        self.record_memory()
+        self.monitor_convergence()
+
+        if self.metrics is not None:
+            self.metrics.setup_time += perf_counter() - setup_start
 
     def tick(self):
+        metrics = self.metrics
+        if metrics is not None:
+            tick_start = perf_counter()
+            metrics.start_lap()
 
-        self.validate()
+        if self.validation_due("run"):
+            self.validate()
+
+        if metrics is not None:
+            metrics.lap("validate")
 
         random.shuffle(self.agents)
 
+        beh_index = self.beh_index
+        if beh_index is not None:
+            beh_index.reorder(self.agents)
+
+        recruit_k = self.recruit_k if self.recruitment == "sampled" else None
+        by_id = self.agents_by_id()
+
         # (A) Conduct any interventions
         for intv in self.interventions:
             if intv.is_setup_phase(self.cur_tick):
-                intv.setup(self.agents, self.network, sui_ORs=self.sui_ORs)
+                intv.setup(
+                    self.agents,
+                    self.network,
+                    sui_ORs=self.sui_ORs,
+                    rng=self.intervention_rng,
+                )
 
             if intv.is_active_phase(self.cur_tick):
                 intv.intervene(self.agents, self.network)
 
+                if beh_index is not None:
+                    for agent in self.agents:
+                        beh_index.update(agent)
+
+        if metrics is not None:
+            metrics.lap("interventions")
+
         # (B) Agents interact with each other and world
         for i, agent in enumerate(self.agents):
 
             # (1) Emulate alters
             self.agents[i].emulate_alters(
-                agents=self.agents, network=self.network, p=self.p_emul
+                agents=self.agents,
+                network=self.network,
+                p=self.p_emul,
+                by_id=by_id,
+                metrics=metrics,
             )
 
+            if beh_index is not None:
+                beh_index.update(self.agents[i])
+
+            if metrics is not None:
+                metrics.lap("emulate")
+
             # (2) Prune old, dissimilar alters
             self.agents[i].prune_alters(
-                agents=self.agents, network=self.network, sim_thresh=self.sim_thresh
+                agents=self.agents,
+                network=self.network,
+                sim_thresh=self.sim_thresh,
+                by_id=by_id,
+                metrics=metrics,
             )
 
+            if metrics is not None:
+                metrics.lap("prune")
+
             # (3) Recruit new, more similar alters
             self.agents[i].recruit_alters(
-                agents=self.agents, network=self.network, sim_thresh=self.sim_thresh
+                agents=self.agents,
+                network=self.network,
+                sim_thresh=self.sim_thresh,
+                index=beh_index,
+                k=recruit_k,
+                by_id=by_id,
+                metrics=metrics,
             )
 
+            if metrics is not None:
+                metrics.lap("recruit")
+
             # (4) Spontaneously change in favor of baserates
             self.agents[i].spontaneously_change(
                 baserates=self.baserates, susceptibility=self.p_spon_change
             )
 
+            if beh_index is not None:
+                beh_index.update(self.agents[i])
+
+            if metrics is not None:
+                metrics.lap("spontaneous_change")
+
             # (5) Consider whether to attempt suicide
             self.agents[i].consider_suicide(
                 odds_ratios=self.sui_ORs,
                 gen_sui_prev=self.gen_sui_prev,
                 gen_ave_beh=self.gen_ave_beh,
+                coefs=self.config.risk_coefs,
             )
 
-        self.validate()
+            if metrics is not None:
+                metrics.lap("suicide")
+                metrics.count_agent_update(self.agents[i])
+
+        if self.validation_due("tick"):
+            self.validate()
+
+        if metrics is not None:
+            metrics.lap("validate")
 
         self.record_history()
 
         self.cur_tick = self.cur_tick + 1
 
+        if metrics is not None:
+            metrics.lap("record_history")
+            metrics.ticks += 1
+            metrics.tick_time += perf_counter() - tick_start
+
+        self.record_memory()
+        self.monitor_convergence()
+
+    @staticmethod
+    def build_interventions(intervention_params):
+        interventions = []
+        for intv_params in intervention_params:
+            intv_class = globals()[intv_params["intv_class_name"]]
+            intv = intv_class(**intv_params)
+            interventions.append(intv)
+
+        return interventions
+
+    def run_until(self, tick):
+        # Tick until `tick` ticks are done, e.g. up to a fork
+        while self.cur_tick < min(tick, self.total_ticks):
+            self.tick()
+
+    def run_burn_in(self, tick):
+        # Tick until `tick` ticks are done, or until the interventions are about
+        # to start if that is earlier (which convergence may bring forward)
+        while self.cur_tick < min(tick, self.start_tick(), self.total_ticks):
+            self.tick()
+
+    def start_tick(self):
+        # When the first intervention starts, after any shift
+        nominal = min([intv["start_tick"] for intv in self.intervention_params])
+
+        return nominal - self.start_shift
+
+    def monitor_convergence(self):
+        # Feed the burn-in's aggregates to the convergence monitor, and move the
+        # start forward once it has converged
+        convergence = self.convergence
+        if convergence is None or convergence.converged_tick is not None:
+            return None
+
+        if self.cur_tick >= self.start_tick():
+            return None
+
+        network = self.history[
+            "networks" if self.recording == "full" else "aggregates"
+        ][-1][0]
+        prevalences = np.mean([a.beh for a in self.agents], axis=0)
+        aggregates = prevalences.tolist() + [
+            network["density"],
+            network["assort_sum_beh"],
+        ]
+
+        if convergence.observe(self.cur_tick, aggregates):
+            self.shift_start(self.converged_shift())
+
+    def converged_shift(self):
+        # How far the start moves forward for a converged burn-in
+        if self.convergence is None or self.convergence.converged_tick is None:
+            return 0
+
+        start = self.convergence.converged_tick + self.converge_margin
+
+        return max(0, self.start_tick() - start)
+
+    def shift_start(self, shift):
+        # Bring the interventions and the end of the run forward by `shift`
+        # ticks, also in the history recorded so far
+        for intv in self.interventions:
+            intv.start_tick -= shift
+            intv.last_tick -= shift
+
+        self.config = self.config.replace(
+            total_ticks=self.total_ticks - shift,
+            start_shift=self.start_shift + shift,
+        )
+
+        self.rerecord_parameters()
+
+    def rerecord_parameters(self):
+        # Replace the parameters and (not yet started) interventions in the
+        # history so far with the current ones
+        self.history["interventions"] = [
+            self.interventions_to_dict() for _ in self.history["interventions"]
+        ]
+        self.history["parameters"] = [
+            self.params_to_dict() for _ in self.history["parameters"]
+        ]
+
+    def close(self):
+        # Release whatever is held between ticks (nothing, in this model)
+        pass
+
+    def fork(self, arms, sim_ids=None):
+        # Branch this simulation here into one copy per arm, `arms` mapping a
+        # branch name to that branch's intervention_params, or to None for a
+        # branch without interventions. Such a branch keeps the sampled
+        # intervention parameters to place its start and end, but records them
+        # as NULL (see SimulationConfig.row). Branches get sim_ids in arm order,
+        # if given.
+        # The burn-in up to here is shared, and with common random numbers the
+        # branches only differ through their interventions: run each with
+        # reseed() then go()
+        assert all([intv.start_tick >= self.cur_tick for intv in self.interventions])
+        assert (sim_ids is None) or (len(sim_ids) == len(arms))
+
+        self.close()
+        crn_seed = int(self.rng.integers(2**32))
+
+        branches = []
+        for i, (name, intervention_params) in enumerate(arms.items()):
+            # the trunk's start shift was for its own interventions
+            changes = {
+                "branch": name,
+                "trunk_id": getattr(self, "sim_id", None),
+                "fork_tick": self.cur_tick,
+                "total_ticks": self.total_ticks + self.start_shift,
+                "start_shift": 0,
+            }
+            if sim_ids is not None:
+                changes["sim_id"] = sim_ids[i]
+            if intervention_params is not None:
+                changes["intervention_params"] = intervention_params
+            else:
+                changes["without_interventions"] = True
+
+            branch = copy.deepcopy(self)
+            branch.config = self.config.replace(**changes)
+            branch.crn_seed = crn_seed
+
+            if intervention_params is None:
+                branch.interventions = []
+            else:
+                branch.interventions = self.build_interventions(intervention_params)
+
+            branch.shift_start(branch.converged_shift())
+
+            # the recorded parameters are the branch's own
+            branch.history["parameters"] = [branch.params_to_dict()]
+
+            branches.append(branch)
+
+        return branches
+
+    def state(self):
+        # The live state, e.g. to cache a burn-in (see burn_in.py)
+        self.close()
+
+        return {attr: getattr(self, attr) for attr in self.state_attrs}
+
+    def restore(self, state):
+        # Continue from another run's state, in place of setup() and the ticks
+        # that state has done. Only valid if that run had the same parameters up
+        # to now: its interventions, which have not started yet, are replaced
+        # by this run's own, also in the history recorded so far
+        assert all(
+            [
+                intv["start_tick"] >= state["cur_tick"]
+                for intv in self.intervention_params
+            ]
+        )
+
+        self.__dict__.update(state)
+        self.interventions = self.build_interventions(self.intervention_params)
+
+        # (which also records this run's parameters in the history so far)
+        self.shift_start(self.converged_shift())
+
+        if self.memory_ticks and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+        if self.validation_due("setup"):
+            self.validate()
+
+    def reseed(self):
+        # Common random numbers for the branches of a fork. `random` is shared
+        # by the whole process, so it is reseeded right before a branch runs
+        random.seed(self.crn_seed)
+
+        seed_seq = np.random.SeedSequence(self.crn_seed)
+        self.rng, self.intervention_rng = [
+            np.random.default_rng(s) for s in seed_seq.spawn(2)
+        ]
+
     def go(self):
-        self.validate()
+        if self.validation_due("run"):
+            self.validate()
 
         while self.cur_tick < self.total_ticks:
             self.tick()
 
-        self.validate()
+        if self.validation_due("run"):
+            self.validate()
+
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def validation_due(self, stage):
+        # stage is "setup" (end of setup), "tick" (end of a tick), or "run"
+        # (start of a tick and before / after go)
+        if self.validation == "paranoid":
+            return True
+
+        if self.validation == "setup":
+            return stage == "setup"
+
+        if self.validation == "periodic":
+            if stage == "setup":
+                return True
+            return stage == "tick" and (self.cur_tick % self.validate_every == 0)
+
+        return False
 
     def validate(self):
 
@@ -122,6 +529,9 @@ class Simulation:
         vertex_names = [v["name"] for v in self.network.vs]
         assert set(agent_names) == set(vertex_names)
 
+        # Each agent's vertex index is its id
+        assert vertex_names == [a.name for a in self.agents_by_id()]
+
         assert self.n_beh == len(self.agents[0].beh)
         assert self.n_beh == len(self.sui_ORs)
         assert self.n_beh == len(self.baserates)
@@ -132,31 +542,55 @@ class Simulation:
 
         return True
 
+    def agents_by_id(self):
+        # The agents listed by id, which is also their vertex index
+        by_id = [None] * len(self.agents)
+        for agent in self.agents:
+            by_id[agent.id] = agent
+
+        return by_id
+
     def agents_to_dict(self):
-        agent_dicts = [a.as_dict(self.agents, self.network) for a in self.agents]
+        by_id = self.agents_by_id()
+        agent_dicts = [
+            a.as_dict(self.agents, self.network, by_id=by_id) for a in self.agents
+        ]
 
         return agent_dicts
 
+    @staticmethod
+    def edge_array(network):
+        # The (n_edges x 2) array of (source, target) vertex indices
+        return np.array(network.get_edgelist(), dtype=int).reshape(-1, 2)
+
+    def edges_to_arrays(self):
+        # The edge table as one array per column, in edge order, read through
+        # igraph's bulk accessors instead of an edge / vertex object per edge
+        edges = self.edge_array(self.network)
+        names = np.array(self.network.vs["name"])
+
+        columns = {
+            "src_index": edges[:, 0],
+            "src_name": names[edges[:, 0]],
+            "tar_index": edges[:, 1],
+            "tar_name": names[edges[:, 1]],
+        }
+
+        return columns
+
     def edges_to_dict(self):
-        edges = []
-        for edge in self.network.es:
-            edges.append(
-                {
-                    "src_index": edge.source,
-                    "src_name": edge.source_vertex["name"],
-                    "tar_index": edge.target,
-                    "tar_name": edge.target_vertex["name"],
-                }
-            )
+        return columns_to_rows(self.edges_to_arrays())
+
+    def verts_to_arrays(self):
+        columns = {
+            "index": np.arange(self.network.vcount()),
+            "name": np.array(self.network.vs["name"]),
+        }
 
-        return edges
+        return columns
 
     def verts_to_dict(self):
-        verts = []
-        for vert in self.network.vs:
-            verts.append({"index": vert.index, "name": vert["name"]})
-
-        return verts
+        return columns_to_rows(self.verts_to_arrays())
 
     def interventions_to_dict(self):
         intv_dicts = []
@@ -167,25 +601,7 @@ class Simulation:
         return intv_dicts
 
     def params_to_dict(self, flat=True, in_list=True):
-        params = copy.deepcopy(self.__dict__)
-
-        non_params = ["network", "agents", "interventions", "history"]
-        params = {key: val for key, val in params.items() if key not in non_params}
-
-        intv_params = params.pop("intervention_params")[0]
-
-        if flat:
-            listlike_params = ["tar_severity"]
-            for listlike in listlike_params:
-                for i, item in enumerate(intv_params.pop(listlike)):
-                    intv_params.update({f"{listlike}{i}": item})
-
-            listlike_params = ["sui_ORs", "baserates"]
-            for listlike in listlike_params:
-                for i, item in enumerate(params.pop(listlike)):
-                    params.update({f"{listlike}{i}": item})
-
-        params.update(intv_params)
+        params = self.config.row(flat)
 
         if in_list:
             params = [params]
@@ -195,29 +611,37 @@ class Simulation:
     def network_to_dict(self, in_list=True):
         d = {}
 
+        degrees = self.network.degree()
         d.update(
             {
                 "density": self.network.density(),
                 "n_agents": len(self.network.vs),
                 "n_edges": len(self.network.es),
-                "n_isolates": len([v for v in self.network.vs if v.degree() == 0]),
+                "n_isolates": degrees.count(0),
             }
         )
 
+        # Assortativity types are listed by vertex, so they come from arrays
+        # with one row per agent id (see Intervention.enrollment_mask), not from
+        # the shuffled agent list
+        beh = Intervention.behavior_matrix(self.agents)
+        cur_risks = np.empty(len(self.agents))
+        for agent in self.agents:
+            cur_risks[agent.id] = agent.current_risk
+
         # individual assortativities
         for i in range(self.n_beh):
-            agent_behs = [a.beh[i] for a in self.agents]
-            assort = self.network.assortativity(types1=agent_behs, directed=False)
+            assort = self.network.assortativity(
+                types1=beh[:, i].tolist(), directed=False
+            )
             d.update({f"assort_beh{i}": assort})
 
-        beh_sums = [sum(a.beh) for a in self.agents]
         d["assort_sum_beh"] = self.network.assortativity(
-            types1=beh_sums, directed=False
+            types1=beh.sum(axis=1).tolist(), directed=False
         )
 
-        cur_risks = [a.current_risk for a in self.agents]
         d["assort_cur_risk"] = self.network.assortativity(
-            types1=cur_risks, directed=False
+            types1=cur_risks.tolist(), directed=False
         )
 
         if in_list:
@@ -225,6 +649,89 @@ class Simulation:
 
         return d
 
+    def outcomes_to_dict(self, in_list=True):
+        # Suicide attempts in the last tick: the sampled count, and the expected
+        # count (the sum of the agents' risks). The expected count estimates
+        # attempt rates with far less variance than the rare sampled attempts
+        expected_attempts = float(sum([a.current_risk for a in self.agents]))
+
+        d = {
+            "n_agents": len(self.agents),
+            "attempts": sum([a.current_attempt for a in self.agents]),
+            "expected_attempts": expected_attempts,
+            "mean_risk": expected_attempts / len(self.agents),
+        }
+
+        if in_list:
+            d = [d]
+
+        return d
+
+    def aggregates_to_dict(self, in_list=True):
+        # The population-level series of "aggregate" recording, in one row
+        beh = Intervention.behavior_matrix(self.agents)
+
+        d = self.network_to_dict(in_list=False)
+        for i, prevalence in enumerate(beh.mean(axis=0).tolist()):
+            d.update({f"prevalence_beh{i}": prevalence})
+        d.update(self.outcomes_to_dict(in_list=False))
+
+        if in_list:
+            d = [d]
+
+        return d
+
+    def population_series(self):
+        # The population-level series, as one dict per recorded tick: the
+        # "aggregates" rows, or the same series gathered from a full history
+        if self.recording == "aggregate":
+            return [objs[0] for objs in self.history["aggregates"]]
+
+        series = []
+        for agents, networks, outcomes in zip(
+            self.history["agents"], self.history["networks"], self.history["outcomes"]
+        ):
+            row = dict(networks[0])
+            for i in range(self.n_beh):
+                behs = [a[f"beh{i}"] for a in agents]
+                row[f"prevalence_beh{i}"] = sum(behs) / len(behs)
+            row.update(outcomes[0])
+
+            series.append(row)
+
+        return series
+
+    def outcome_summary(self, in_list=True):
+        # The outcomes totalled over the run, and over the ticks from the
+        # interventions' (effective) start on. History index i holds the tick
+        # that left i ticks completed, so tick t is at index t + 1
+        outcomes_of = "outcomes" if self.recording == "full" else "aggregates"
+        per_tick = [objs[0] for objs in self.history[outcomes_of][1:]]
+        from_start = per_tick[self.start_tick() :]
+
+        d = {"sim_id": self.sim_id, "start_tick": self.start_tick()}
+        for suffix, outcomes in [("", per_tick), ("_from_start", from_start)]:
+            agent_ticks = sum([o["n_agents"] for o in outcomes])
+            attempts = sum([o["attempts"] for o in outcomes])
+            expected_attempts = sum([o["expected_attempts"] for o in outcomes])
+
+            d.update(
+                {
+                    f"ticks{suffix}": len(outcomes),
+                    f"agent_ticks{suffix}": agent_ticks,
+                    f"attempts{suffix}": attempts,
+                    f"expected_attempts{suffix}": expected_attempts,
+                    f"attempt_rate{suffix}": attempts / max(agent_ticks, 1),
+                    f"expected_attempt_rate{suffix}": expected_attempts
+                    / max(agent_ticks, 1),
+                }
+            )
+
+        if in_list:
+            d = [d]
+
+        return d
+
     # def record_history(self):
 
     #     self.history["agents"].append(copy.deepcopy(self.agents_to_dict()))
@@ -238,98 +745,107 @@ class Simulation:
 
     def record_history(self):
 
-        self.history["agents"].append(self.agents_to_dict())
-        self.history["edges"].append(self.edges_to_dict())
-        # self.history["vertices"].append(self.verts_to_dict())
-        self.history["networks"].append(self.network_to_dict())
+        if self.recording == "full":
+            self.history["agents"].append(self.agents_to_dict())
+            self.history["edges"].append(self.edges_to_dict())
+            # self.history["vertices"].append(self.verts_to_dict())
+            self.history["networks"].append(self.network_to_dict())
+            self.history["outcomes"].append(self.outcomes_to_dict())
+        else:
+            self.history["aggregates"].append(self.aggregates_to_dict())
+
         self.history["interventions"].append(self.interventions_to_dict())
 
         if self.cur_tick <= 1:
             self.history["parameters"].append(self.params_to_dict())
 
-    def tag_history(self):
+    def record_memory(self):
+        if self.cur_tick not in self.memory_ticks:
+            return None
 
-        # Go through each kind of history. Within each kind of history,
-        # tag all of the individual items with the correct tick and with the
-        # sim_id for this simulation, which can be used to uniquely identify it
+        report = memory_report(self)
+        report.update({"tick": self.cur_tick, "sim_id": getattr(self, "sim_id", None)})
 
-        for aspect in self.history:
-            for i, objs in enumerate(self.history[aspect]):
-                for obj in objs:
-                    obj.update({"tick": i, "sim_id": self.sim_id})
+        self.memory_reports.append(report)
 
-    def history_to_db(self, con, history_of=None, simplify=True):
-        if history_of is None:
-            history_aspects = ["agents", "edges", "parameters"]
-        else:
-            history_aspects = history_of
+        return report
 
-        for history_aspect in history_aspects:
-            history = self.history_to_dataframe(history_aspect)
-            # history["seed"] = self.seed
-            history["sample_num"] = self.sample_num
+    def export_aspects(self):
+        return HISTORY_ASPECTS[self.recording] + ["outcome_summary"]
 
-            if simplify and history_aspect == "parameters":
-                history = history.iloc[[0]]
+    def history_rows(self, aspect, simplify=True):
+        # One aspect of the history as database rows: (columns, rows), with rows
+        # a generator of tuples. Each row is tagged with its tick (the history
+        # index) and the sim_id for this simulation, which can be used to
+        # uniquely identify it, as it is read. The history itself is left as
+        # recorded and no copy of it is built. columns is None if there are no
+        # rows (e.g. the interventions of a branch without any)
+        if aspect == "outcome_summary":
+            summary = self.outcome_summary()
+            return list(summary[0]), (tuple(row.values()) for row in summary)
 
-            history.to_sql(history_aspect, con, if_exists="append", index=False)
+        history = self.history[aspect]
+        if simplify and aspect == "parameters":
+            history = history[:1]
 
-    def history_for_db(self, simplify=True):
-        self.tag_history()
+        last = next((objs[-1] for objs in reversed(history) if objs), None)
+        if last is None:
+            return None, iter(())
 
-        exportable_history = {}
-        for history_of in [
-            "agents",
-            "edges",
-            "parameters",
-            "networks",
-            "interventions",
-        ]:
-            flat_history = list(chain.from_iterable(self.history[history_of]))
-            exportable_history[history_of] = flat_history
-
-        if simplify:
-            exportable_history["parameters"] = [exportable_history["parameters"][0]]
+        keys = [key for key in last if key not in ["tick", "sim_id"]]
+        sim_id = self.sim_id
 
-        return exportable_history
+        def rows():
+            for tick, objs in enumerate(history):
+                for obj in objs:
+                    yield tuple([obj[key] for key in keys]) + (tick, sim_id)
 
-    @staticmethod
-    def db_var_types(dict_list):
-        db_mapping = {
-            "<class 'int'>": "INTEGER",
-            "<class 'numpy.int64'>": "INTEGER",
-            "<class 'str'>": "TEXT",
-            "<class 'bool'>": "INTEGER",
-            "<class 'float'>": "REAL",
-            "<class 'numpy.float64'>": "REAL",
-        }
+        return keys + ["tick", "sim_id"], rows()
 
-        var_types = {}
-        for key, val in dict_list.items():
-            var_type = db_mapping[str(type(val))]
-            var_types.update({key: var_type})
+    def history_for_db(self, simplify=True):
+        # The exported rows as dicts, to look at. The database is written
+        # straight from history_rows()
+        exportable_history = {}
+        for aspect in self.export_aspects():
+            columns, rows = self.history_rows(aspect, simplify)
+            exportable_history[aspect] = [dict(zip(columns, row)) for row in rows]
 
-        return var_types
+        return exportable_history
 
     def create_history_tables(self, con):
-        history = self.history_for_db()
+        for aspect in self.export_aspects():
+            columns, _ = self.history_rows(aspect)
+            if columns is None:
+                continue
 
-        for aspect, data in history.items():
-            var_types = ", ".join(Simulation.db_var_types(data[-1]))
-            query = f"CREATE TABLE IF NOT EXISTS {aspect}({var_types})"
+            query = f"CREATE TABLE IF NOT EXISTS {aspect}({', '.join(columns)})"
 
             with con:
                 con.execute(query)
 
     def insert_history_to_db(self, con):
-        history = self.history_for_db()
+        for aspect in self.export_aspects():
+            columns, rows = self.history_rows(aspect)
+            if columns is None:
+                continue
 
-        for aspect, data in history.items():
-            colnames = ", ".join([f":{key}" for key in data[-1]])
-            query = f"INSERT INTO {aspect} VALUES({colnames})"
+            params = ", ".join(["?"] * len(columns))
+            query = f"INSERT INTO {aspect}({', '.join(columns)}) VALUES({params})"
 
             with con:
-                con.executemany(query, data)
+                con.executemany(query, rows)
+
+        if self.memory_reports:
+            self.insert_memory_to_db(con)
+
+    def insert_memory_to_db(self, con):
+        colnames = list(self.memory_reports[-1])
+
+        with con:
+            con.execute(f"CREATE TABLE IF NOT EXISTS memory({', '.join(colnames)})")
+
+            params = ", ".join([f":{key}" for key in colnames])
+            con.executemany(f"INSERT INTO memory VALUES({params})", self.memory_reports)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+import numpy as np
+
+# Streaming summaries across the simulations of an ensemble.
+#
+# The writer folds each simulation into running means and variances (Welford's
+# algorithm) of its population-level series, per tick and per group of
+# simulations, as the simulations arrive. Groups are given by parameter columns,
+# e.g. ["intv_class_name"] or, for branched runs, ["branch"]. The summary is
+# written as one row per group, tick and series:
+#
+#   <group columns>, tick, variable, n, mean, variance
+#
+# with n the number of simulations with a value for that series (assortativity
+# is undefined in some networks), so analyses need not load the raw history.
+
+
+class RunningStats:
+    # Means and (sample) variances of a vector of series, skipping NaNs
+    def __init__(self, n_values):
+        self.n = np.zeros(n_values, dtype=int)
+        self.mean = np.zeros(n_values)
+        self.m2 = np.zeros(n_values)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        seen = ~np.isnan(values)
+
+        self.n[seen] += 1
+        delta = values[seen] - self.mean[seen]
+        self.mean[seen] += delta / self.n[seen]
+        self.m2[seen] += delta * (values[seen] - self.mean[seen])
+
+    def variance(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.n > 1, self.m2 / (self.n - 1), np.nan)
+
+
+class EnsembleSummary:
+    def __init__(self, group_by=("intv_class_name",)):
+        self.group_by = list(group_by)
+        self.variables = None  # fixed by the first simulation
+        self.stats = {}  # (group values..., tick) -> RunningStats
+        self.n_simulations = 0
+
+    def add(self, sim):
+        params = sim.history["parameters"][0][0]
+        group = tuple([params.get(key) for key in self.group_by])
+
+        series = sim.population_series()
+        if self.variables is None:
+            self.variables = [key for key in series[0] if key not in ["tick", "sim_id"]]
+
+        for tick, row in enumerate(series):
+            key = group + (tick,)
+            if key not in self.stats:
+                self.stats[key] = RunningStats(len(self.variables))
+
+            self.stats[key].add([row.get(var, np.nan) for var in self.variables])
+
+        self.n_simulations += 1
+
+    def rows(self):
+        rows = []
+        for key, stats in self.stats.items():
+            variances = stats.variance()
+            for i, var in enumerate(self.variables):
+                row = dict(zip(self.group_by, key[:-1]))
+                row.update(
+                    {
+                        "tick": key[-1],
+                        "variable": var,
+                        "n": int(stats.n[i]),
+                        "mean": float(stats.mean[i]) if stats.n[i] else None,
+                        "variance": float(variances[i]) if stats.n[i] > 1 else None,
+                    }
+                )
+                rows.append(row)
+
+        return rows
+
+    def insert_to_db(self, con, table="summary"):
+        rows = self.rows()
+        if not rows:
+            return None
+
+        colnames = list(rows[0])
+        with con:
+            con.execute(f"CREATE TABLE IF NOT EXISTS {table}({', '.join(colnames)})")
+
+            params = ", ".join([f":{key}" for key in colnames])
+            con.executemany(f"INSERT INTO {table} VALUES({params})", rows)
+
+        return len(rows)
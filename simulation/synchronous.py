@@ -0,0 +1,535 @@
+import random
+import numpy as np
+
+from time import perf_counter
+
+from behavior_index import BehaviorIndex
+from intervention import Intervention
+from parallel import ShardPool
+from simulation import Simulation
+
+# Agents are updated in shards of this many consecutive ids. Each shard draws
+# from its own random stream, so results depend on the seed but not on how many
+# processes the shards are spread over
+SHARD_SIZE = 2048
+
+# Steps of a shard update, in the order they run
+SHARD_PHASES = ["emulate", "prune", "recruit", "spontaneous_change", "suicide"]
+
+
+def ragged_ranges(starts, sizes):
+    # The ranges starts[k], ..., starts[k] + sizes[k] - 1 laid end to end, and
+    # the k each entry came from
+    owners = np.repeat(np.arange(len(sizes)), sizes)
+    local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    return starts[owners] + local, owners
+
+
+def adjacency(edges, n):
+    # Compressed adjacency lists of the (undirected) edges: the neighbors of
+    # vertex i are neighbors[offsets[i] : offsets[i + 1]], in ascending order,
+    # and edge_ids holds the id of the edge behind each entry
+    src = np.concatenate([edges[:, 0], edges[:, 1]])
+    dst = np.concatenate([edges[:, 1], edges[:, 0]])
+
+    order = np.lexsort((dst, src))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))])
+
+    return dst[order], offsets, order % max(len(edges), 1)
+
+
+def profile_groups(beh, radius):
+    # Rows grouped by behavior profile. The members of profile a are
+    # members[member_starts[a] :][: member_counts[a]], and the profiles within
+    # Hamming distance `radius` of it (a included) are
+    # profile_neighbors[profile_offsets[a] : profile_offsets[a + 1]]
+    profiles, labels, counts = np.unique(
+        beh, axis=0, return_inverse=True, return_counts=True
+    )
+    labels = labels.ravel()
+
+    matches = profiles @ profiles.T + (1 - profiles) @ (1 - profiles).T
+    a, b = np.nonzero(beh.shape[1] - matches <= radius)
+
+    groups = {
+        "labels": labels,
+        "members": np.argsort(labels, kind="stable"),
+        "member_starts": np.cumsum(counts) - counts,
+        "member_counts": counts,
+        "profile_neighbors": b,
+        "profile_offsets": np.concatenate(
+            [[0], np.cumsum(np.bincount(a, minlength=len(profiles)))]
+        ),
+    }
+
+    return groups
+
+
+def distances(beh, pairs):
+    # Hamming distance between the rows of each pair
+    return (beh[pairs[:, 0]] != beh[pairs[:, 1]]).sum(axis=1)
+
+
+def distinct_draws(sizes, k, rng):
+    # min(k, size) draws without replacement from range(size), for each of the
+    # sizes, as (index into sizes, value) rows. Repeated values are drawn again
+    # until each row has enough. Rows that need more than half their range pick
+    # the values to leave out instead, so at least half of every redraw is new
+    rows = np.arange(len(sizes))
+    n_draws = np.minimum(k, sizes)
+    leave_out = n_draws > sizes // 2
+    n_picks = np.where(leave_out, sizes - n_draws, n_draws)
+
+    width = sizes.max(initial=0) + 1
+    picked = np.empty(0, dtype=int)  # row * width + value
+    missing = n_picks
+    while missing.any():
+        redraws = np.repeat(rows, missing)
+        values = (rng.random(len(redraws)) * sizes[redraws]).astype(int)
+        picked = np.sort(np.concatenate([picked, redraws * width + values]))
+        picked = picked[np.diff(picked, prepend=-1) > 0]
+        missing = n_picks - np.bincount(picked // width, minlength=len(rows))
+
+    kept = picked[~leave_out[picked // width]]
+
+    # every value of the leave-out rows but the picked ones
+    values, owners = ragged_ranges(
+        np.zeros(leave_out.sum(), dtype=int), sizes[leave_out]
+    )
+    complement = rows[leave_out][owners] * width + values
+    # (picked is sorted, so each lookup is a binary search; the -1 past its
+    # end matches nothing)
+    padded = np.append(picked, -1)
+    complement = complement[padded[np.searchsorted(picked, complement)] != complement]
+
+    draws = np.sort(np.concatenate([kept, complement]))
+
+    return draws // width, draws % width
+
+
+def sample_non_neighbors(neighbors, offsets, n, k, rng, first=0):
+    # k draws without replacement (or all of them, if fewer) from the
+    # non-neighbors, other than themselves, of the vertices first, first + 1,
+    # ... (out of n), whose adjacency lists are given, as (vertex, draw) rows.
+    # The slots of the r-th vertex are r * n + j for every j. Laid end to end,
+    # the free slots of all vertices can be numbered, and the q-th free slot is
+    # q plus the number of taken slots up to it, which one searchsorted finds
+    # for all draws at once
+    rows = np.arange(len(offsets) - 1)
+    degree = np.diff(offsets)
+    n_free = n - 1 - degree
+
+    taken = np.sort(
+        np.concatenate(
+            [np.repeat(rows, degree) * n + neighbors, rows * n + first + rows]
+        )
+    )
+    gaps = taken - np.arange(len(taken))
+
+    draws, r = distinct_draws(n_free, k, rng)
+    q = draws * n - offsets[draws] - draws + r
+    slots = q + np.searchsorted(gaps, q, side="right")
+
+    return np.column_stack([first + draws, slots - draws * n])
+
+
+def update_shard(state, params, start, stop, seed):
+    # Every step of the tick for agents start, ..., stop - 1, decided from the
+    # state at the start of the tick. `state` holds the population arrays
+    # (behaviors, adjacency and, for exhaustive recruitment, profile groups),
+    # `params` the model parameters. Returns the shard's new behavior rows and
+    # counters, the edges it drops and adds as (u, v) pairs with u < v, its
+    # number of similarity evaluations and the time spent on each step
+    rng = np.random.default_rng(seed)
+    timings = {}
+    lap = perf_counter()
+
+    beh = state["beh"]
+    n = len(beh)
+    first = state["offsets"][start]
+    offsets = state["offsets"][start : stop + 1] - first
+    neighbors = state["neighbors"][first : first + offsets[-1]]
+    edge_ids = state["edge_ids"][first : first + offsets[-1]]
+    degree = np.diff(offsets)
+    rows = np.arange(start, stop)
+
+    counters = {"emulatable_alters": degree}
+
+    # (1) Emulate alters. Each behavior is copied, with probability p_emul,
+    # from an alter drawn at random. Agents without alters keep their behaviors
+    shard_beh = beh[start:stop].copy()
+    emulating = rng.random(shard_beh.shape) < params["p_emul"]
+    r, c = np.nonzero(emulating & (degree > 0)[:, None])
+
+    picks = offsets[r] + (rng.random(len(r)) * degree[r]).astype(int)
+    copied = beh[neighbors[picks], c]
+    shard_beh[r, c] = copied
+
+    counters["current_emulations"] = np.bincount(r, minlength=len(rows))
+    counters["current_emulated_risk_factors"] = np.bincount(
+        r, weights=copied, minlength=len(rows)
+    ).astype(int)
+
+    timings["emulate"] = perf_counter() - lap
+    lap = perf_counter()
+
+    # (2) Prune old, dissimilar alters. Both ends of a dissimilar edge drop it,
+    # the lower one reports it
+    alters = np.column_stack([np.repeat(rows, degree), neighbors])
+    dissimilar = distances(beh, alters) > params["radius"]
+
+    counters["pruned_alters"] = np.bincount(
+        alters[dissimilar, 0] - start, minlength=len(rows)
+    )
+    dropped = edge_ids[dissimilar & (alters[:, 0] < alters[:, 1])]
+    n_evals = len(alters)
+
+    timings["prune"] = perf_counter() - lap
+    lap = perf_counter()
+
+    # (3) Recruit new, more similar alters
+    if params["recruit_k"] is not None:
+        # every agent draws recruit_k candidates from its non-neighbors and
+        # recruits the similar ones
+        candidates = sample_non_neighbors(
+            neighbors, offsets, n, params["recruit_k"], rng, first=start
+        )
+        recruits = candidates[distances(beh, candidates) <= params["radius"]]
+
+        counters["recruit_candidates"] = np.bincount(
+            candidates[:, 0] - start, minlength=len(rows)
+        )
+        added = np.sort(recruits, axis=1)
+        n_evals += len(candidates)
+    else:
+        # every agent recruits every similar enough non-neighbor: the members of
+        # nearby profiles. Each new edge is reported by its lower end
+        labels = state["labels"][start:stop]
+        profile_offsets = state["profile_offsets"]
+        nearby, owners = ragged_ranges(
+            profile_offsets[labels],
+            profile_offsets[labels + 1] - profile_offsets[labels],
+        )
+        nearby = state["profile_neighbors"][nearby]
+
+        similar, owners2 = ragged_ranges(
+            state["member_starts"][nearby], state["member_counts"][nearby]
+        )
+        u = rows[owners[owners2]]
+        v = state["members"][similar]
+
+        keep = v > u
+        u, v = u[keep], v[keep]
+        existing = np.isin(u * n + v, alters[:, 0] * n + alters[:, 1])
+
+        counters["recruit_candidates"] = n - 1 - degree
+        added = np.column_stack([u, v])[~existing]
+
+    timings["recruit"] = perf_counter() - lap
+    lap = perf_counter()
+
+    # (4) Spontaneously change in favor of baserates
+    changing = rng.random(shard_beh.shape) < params["p_spon_change"]
+    r, c = np.nonzero(changing)
+
+    changed = (rng.random(len(r)) < params["baserates"][c]).astype(beh.dtype)
+    shard_beh[r, c] = changed
+
+    counters["current_spon_changes"] = np.bincount(r, minlength=len(rows))
+    counters["current_spon_risk_factors"] = np.bincount(
+        r, weights=changed, minlength=len(rows)
+    ).astype(int)
+
+    timings["spontaneous_change"] = perf_counter() - lap
+    lap = perf_counter()
+
+    # (5) Consider whether to attempt suicide: Agent.suicide_risk() for every
+    # agent, from its end of tick behaviors
+    log_odds = shard_beh @ params["log_ORs"]
+    risk = 1 / (1 + np.exp(-(params["intercept"] + log_odds - params["adjustment"])))
+
+    counters["current_risk"] = risk
+    counters["current_attempt"] = (rng.random(len(rows)) < risk).astype(int)
+
+    timings["suicide"] = perf_counter() - lap
+
+    result = {
+        "beh": shard_beh,
+        "counters": counters,
+        "dropped": dropped,
+        "added": added,
+        "similarity_evals": n_evals,
+        "timings": timings,
+    }
+
+    return result
+
+
+class SynchronousSimulation(Simulation):
+    # Synchronous-update variant of the model. In Simulation.tick() agents
+    # update one at a time, each seeing the changes made by the agents before
+    # it. Here every agent's emulation, prune / recruit decisions and
+    # spontaneous changes are computed from the state at the start of the tick
+    # and applied together, so each step is a handful of array operations over
+    # a shard of the population (update_shard).
+    #
+    # The (n_agents x n_beh) behavior matrix `beh`, with rows indexed by agent
+    # id, is the state during a tick. The Agent objects are brought up to date
+    # at the end of every tick, so history, validation and list-based
+    # interventions see the same agents as in the sequential model.
+    #
+    # Without a recruitment bound every agent recruits every similar enough
+    # non-neighbor and prunes every dissimilar alter, so after the network step
+    # two agents are connected exactly when they are similar enough. "scan" and
+    # "indexed" recruitment are the same thing here.
+    #
+    # With workers > 1 the shards are spread over a process pool, which reads
+    # the population arrays from shared memory. Edge changes are applied by
+    # this process once all shards are done.
+
+    state_attrs = Simulation.state_attrs + ["beh"]
+
+    def __init__(self, ticks, workers=1, **kwargs):
+        assert workers >= 1
+
+        super().__init__(ticks, **kwargs)
+        self.workers = workers
+        self.shard_pool = None
+
+        # Built at the end of setup()
+        self.beh = None
+
+    def setup(self):
+        super().setup()
+
+        self.beh_index = None
+        self.beh = Intervention.behavior_matrix(self.agents)
+
+    def tick(self):
+        metrics = self.metrics
+        if metrics is not None:
+            tick_start = perf_counter()
+            metrics.start_lap()
+
+        if self.validation_due("run"):
+            self.validate()
+
+        if metrics is not None:
+            metrics.lap("validate")
+
+        # Only decides the order interventions enroll agents in
+        random.shuffle(self.agents)
+
+        # (A) Conduct any interventions
+        for intv in self.interventions:
+            if intv.is_setup_phase(self.cur_tick):
+                intv.setup(
+                    self.agents,
+                    self.network,
+                    sui_ORs=self.sui_ORs,
+                    rng=self.intervention_rng,
+                )
+
+            if intv.is_active_phase(self.cur_tick):
+                self.intervene(intv)
+
+        if metrics is not None:
+            metrics.lap("interventions")
+
+        # (B) Agents interact with each other and world, shard by shard
+        state, params = self.shard_inputs()
+
+        if metrics is not None:
+            metrics.lap("recruit")
+
+        n = len(self.beh)
+        seeds = self.rng.integers(2**63, size=-(-n // SHARD_SIZE))
+        shards = [
+            (start, min(start + SHARD_SIZE, n), seed)
+            for start, seed in zip(range(0, n, SHARD_SIZE), seeds)
+        ]
+        results = self.map_shards(state, params, shards)
+
+        if metrics is not None:
+            timings = [result["timings"] for result in results]
+            metrics.split_lap(
+                {phase: sum([t[phase] for t in timings]) for phase in SHARD_PHASES}
+            )
+
+        # Apply the edge changes all shards decided on
+        dropped = np.concatenate([result["dropped"] for result in results])
+        self.network.delete_edges(dropped.tolist())
+
+        if metrics is not None:
+            metrics.lap("prune")
+
+        added = np.concatenate([result["added"] for result in results])
+        if params["recruit_k"] is not None:
+            # pairs that drew each other make one edge
+            added = np.unique(added, axis=0)
+        self.network.add_edges(added.tolist())
+
+        if metrics is not None:
+            metrics.lap("recruit")
+
+        self.beh = np.concatenate([result["beh"] for result in results])
+        counters = {
+            key: np.concatenate([result["counters"][key] for result in results])
+            for key in results[0]["counters"]
+        }
+        # a new edge is one more alter for both its ends, however it was found
+        counters["recruited_alters"] = np.bincount(added.ravel(), minlength=n)
+        self.update_agents(counters)
+
+        if metrics is not None:
+            metrics.lap("suicide")
+
+            # One adjacency build stands in for every agent's alter lookups
+            metrics.count("alter_lookups")
+            metrics.count(
+                "similarity_evals",
+                params["profile_comparisons"]
+                + sum([result["similarity_evals"] for result in results]),
+            )
+            metrics.count("edges_removed", len(dropped))
+            metrics.count("edges_added", len(added))
+
+        if self.validation_due("tick"):
+            self.validate()
+
+        if metrics is not None:
+            metrics.lap("validate")
+
+        self.record_history()
+
+        self.cur_tick = self.cur_tick + 1
+
+        if metrics is not None:
+            metrics.lap("record_history")
+            metrics.ticks += 1
+            metrics.tick_time += perf_counter() - tick_start
+
+        self.record_memory()
+        self.monitor_convergence()
+
+    def go(self):
+        try:
+            super().go()
+        finally:
+            self.close()
+
+    def close(self):
+        # The pool cannot outlive the run (or travel with a finished simulation)
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+            self.shard_pool = None
+
+    def intervene(self, intv):
+        # Interventions that keep the base class entry point only need the
+        # array protocol. Any other intervention works on the Agent objects,
+        # which are up to date at this point, and is read back afterwards
+        if type(intv).intervene is Intervention.intervene:
+            intv.intervene_masked(self.beh, intv.enrolled_mask, self.network)
+        else:
+            intv.intervene(self.agents, self.network)
+            self.beh = Intervention.behavior_matrix(self.agents)
+
+    def shard_inputs(self):
+        # The population arrays and parameters update_shard() works from
+        radius = BehaviorIndex.max_distance(self.n_beh, self.sim_thresh)
+        neighbors, offsets, edge_ids = adjacency(
+            self.edge_array(self.network), len(self.beh)
+        )
+
+        state = {
+            "beh": self.beh,
+            "neighbors": neighbors,
+            "offsets": offsets,
+            "edge_ids": edge_ids,
+        }
+
+        recruit_k = self.recruit_k if self.recruitment == "sampled" else None
+        if recruit_k is None:
+            groups = profile_groups(self.beh, radius)
+            state.update(groups)
+            n_profiles = len(groups["member_counts"])
+            profile_comparisons = n_profiles * (n_profiles + 1) // 2
+        else:
+            profile_comparisons = 0
+
+        intercept, log_ORs, adjustment = self.config.risk_coefs
+
+        params = {
+            "p_emul": self.p_emul,
+            "p_spon_change": self.p_spon_change,
+            "baserates": np.asarray(self.baserates, dtype=float),
+            "radius": radius,
+            "recruit_k": recruit_k,
+            "log_ORs": np.asarray(log_ORs, dtype=float),
+            "intercept": intercept,
+            "adjustment": adjustment,
+            "profile_comparisons": profile_comparisons,
+        }
+
+        return state, params
+
+    def map_shards(self, state, params, shards):
+        if self.workers == 1:
+            return [update_shard(state, params, *shard) for shard in shards]
+
+        if self.shard_pool is None:
+            self.shard_pool = ShardPool(self.workers)
+
+        return self.shard_pool.map(update_shard, state, params, shards)
+
+    def update_agents(self, counters):
+        # Copy the tick's behaviors and counters onto the Agent objects
+        beh = self.beh.tolist()
+        columns = {attr: values.tolist() for attr, values in counters.items()}
+
+        for agent in self.agents:
+            agent.beh = beh[agent.id]
+
+            for attr, values in columns.items():
+                setattr(agent, attr, values[agent.id])
+
+            agent.attempts += agent.current_attempt
+
+    def validate(self):
+        super().validate()
+
+        # The behavior matrix and the agents agree
+        if self.beh is not None:
+            assert self.beh.shape == (len(self.agents), self.n_beh)
+            assert (self.beh == Intervention.behavior_matrix(self.agents)).all()
+
+        return True
+
+    def agents_to_dict(self):
+        # Agent.as_dict(agents, network), with the mean similarity to alters
+        # computed for all agents at once
+        beh = Intervention.behavior_matrix(self.agents)
+        edges = self.edge_array(self.network)
+        n = len(beh)
+
+        similarity = 1 - distances(beh, edges) / self.n_beh
+        degree = np.bincount(edges.ravel(), minlength=n)
+        total = np.bincount(
+            edges.ravel(), weights=np.repeat(similarity, 2), minlength=n
+        )
+        mean_sim = (total / np.maximum(degree, 1)).tolist()
+
+        agent_dicts = []
+        for agent in self.agents:
+            dic = agent.as_dict(beh_as_list=True)
+            dic.update(
+                {"mean_similarity": mean_sim[agent.id] if degree[agent.id] else None}
+            )
+
+            for i, beh in enumerate(dic.pop("beh")):
+                dic.update({f"beh{i}": beh})
+
+            agent_dicts.append(dic)
+
+        return agent_dicts
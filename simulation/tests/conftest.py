@@ -0,0 +1,42 @@
+import pytest
+
+
+# Parameters of a small simulation with a single intervention. Tests pass the
+# parameters they change, and intervention changes as a dict
+@pytest.fixture
+def sim_params():
+    def make(intervention=None, **kwargs):
+        params = {
+            "ticks": 8,
+            "n_agents": 20,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.30,
+            "p_emul": 0.25,
+            "p_spon_change": 0.25,
+            "sim_thresh": 0.60,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "seed": 1234,
+            "sample_num": 0,
+            "sim_id": 0,
+            "validation": "setup",
+            "intervention_params": [
+                {
+                    "intv_class_name": "MockInterventionA",
+                    "start_tick": 4,
+                    "duration": 3,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0.25,
+                    "p_enrolled": 0.50,
+                    "p_beh_change": 0.50,
+                }
+            ],
+        }
+        params["intervention_params"][0].update(intervention or {})
+        params.update(kwargs)
+
+        return params
+
+    return make
@@ -1,6 +1,10 @@
+import copy
+import pytest
 from math import exp
 import igraph as ig
 from agent import Agent
+from memory import deep_sizeof
+from metrics import SimulationMetrics
 
 
 class TestAgent:
@@ -30,6 +34,23 @@ class TestAgent:
         d = Agent(id=4, n_beh=100, baserates=[0.25] * 100)
         assert (0 < sum(d.beh)) and (sum(d.beh) < 50)
 
+    def test_slots(self):
+        a = Agent(id=7, n_beh=3)
+
+        assert not hasattr(a, "__dict__")
+        assert a.name == "id_7"
+        assert a.as_dict()["name"] == "id_7"
+
+        with pytest.raises(AttributeError):
+            a.mood = 1
+
+        # copies and pickles keep every slot
+        b = copy.deepcopy(a)
+        assert b.as_dict() == a.as_dict()
+
+        # the behaviors are counted with the agent
+        assert deep_sizeof(a) > deep_sizeof(a.beh)
+
     def test_emulate(self):
         a = Agent(id=1, n_beh=3)
         a.beh = [0, 0, 0]
@@ -176,6 +197,47 @@ class TestAgent:
         assert isinstance(alters, list)
         assert not alters
 
+    def test_alters_by_id(self):
+        # ids are vertex indices, as in a Simulation
+        agents = [Agent(id=i, n_beh=3) for i in range(5)]
+        net = ig.Graph(n=5, edges=[(0, 1), (0, 3), (2, 4)])
+        net.vs["name"] = [agent.name for agent in agents]
+
+        shuffled = [agents[i] for i in [3, 0, 4, 2, 1]]
+        alters = agents[0].alters(shuffled, net, by_id=agents)
+        assert alters == [agents[1], agents[3]]
+        assert set(alters) == set(agents[0].alters(shuffled, net))
+
+        assert agents[4].alters(shuffled, net, by_id=agents) == [agents[2]]
+
+    def test_rewire_by_id(self):
+        # Pruning and recruiting by id change the same edges as by name, and do
+        # the same work
+        edge_sets = []
+        for by_id in [False, True]:
+            agents = [Agent(id=i, n_beh=3) for i in range(5)]
+            for agent, beh in zip(agents, [[1, 1, 1], [1, 1, 0], [0, 0, 0], [1, 0, 1]]):
+                agent.beh = beh
+            agents[4].beh = [0, 1, 1]
+
+            net = ig.Graph(n=5, edges=[(0, 1), (0, 2), (3, 4)])
+            net.vs["name"] = [agent.name for agent in agents]
+            shuffled = [agents[i] for i in [3, 0, 4, 2, 1]]
+            metrics = SimulationMetrics()
+            kwargs = {"by_id": agents} if by_id else {}
+
+            agents[0].prune_alters(shuffled, net, 0.50, metrics=metrics, **kwargs)
+            agents[0].recruit_alters(shuffled, net, 0.50, metrics=metrics, **kwargs)
+            assert (agents[0].pruned_alters, agents[0].recruited_alters) == (1, 2)
+
+            # two alters compared when pruning, three candidates when recruiting
+            assert metrics.counts["alter_lookups"] == 2
+            assert metrics.counts["similarity_evals"] == 2 + 3
+
+            edge_sets.append(set(net.get_edgelist()))
+
+        assert edge_sets[0] == edge_sets[1] == {(0, 1), (0, 3), (0, 4), (3, 4)}
+
     def test_recruit_alters(self):
         # Intentionally odd IDs, to ensure method works when orderly IDs cant
         # be relied on
@@ -213,6 +275,33 @@ class TestAgent:
         assert ("id_33", "id_123") not in edges
         assert ("id_101", "id_123") in edges
 
+    def test_recruit_alters_sampled(self):
+        a = Agent(id=0, n_beh=3)
+        a.beh = [1, 1, 1]
+
+        # everyone is similar enough to recruit
+        agents = [a] + [Agent(id=i, n_beh=3) for i in range(1, 20)]
+        for agent in agents:
+            agent.beh = [1, 1, 1]
+
+        # a is already connected to id_1 and id_2
+        net = ig.Graph(n=20, edges=[(0, 1), (0, 2), (3, 4)])
+        net.vs["name"] = [agent.name for agent in agents]
+
+        # only k candidates are considered, and none are existing alters
+        a.recruit_alters(agents, net, sim_thresh=0.50, k=5)
+        assert a.recruit_candidates == 5
+        assert a.recruited_alters == 5
+        assert net.degree(0) == 7
+        assert not net.has_multiple()
+        assert not net.is_loop(range(net.ecount())).count(True)
+
+        # asking for more candidates than there are non-neighbors takes them all
+        a.recruit_alters(agents, net, sim_thresh=0.50, k=100)
+        assert a.recruit_candidates == 12
+        assert net.degree(0) == 19
+        assert not net.has_multiple()
+
     def test_prune_alters(self):
         # Intentionally odd IDs, to ensure method works when orderly IDs cant
         # be relied on
@@ -0,0 +1,59 @@
+import random
+from agent import Agent
+from behavior_index import BehaviorIndex
+
+
+class TestBehaviorIndex:
+    def test_init(self):
+        agents = [Agent(id=i, n_beh=3) for i in range(4)]
+        agents[0].beh = [1, 0, 0]
+        agents[1].beh = [0, 0, 0]
+        agents[2].beh = [1, 0, 0]
+        agents[3].beh = [1, 1, 1]
+
+        index = BehaviorIndex(agents)
+
+        assert set(index.buckets) == {(1, 0, 0), (0, 0, 0), (1, 1, 1)}
+        assert set(index.buckets[(1, 0, 0)]) == {0, 2}
+        assert index.profiles[3] == (1, 1, 1)
+        assert index.positions == {0: 0, 1: 1, 2: 2, 3: 3}
+
+    def test_update(self):
+        agents = [Agent(id=i, n_beh=3) for i in range(2)]
+        agents[0].beh = [1, 0, 0]
+        agents[1].beh = [0, 0, 0]
+
+        index = BehaviorIndex(agents)
+
+        agents[1].beh = [1, 0, 0]
+        index.update(agents[1])
+
+        # empty buckets are dropped
+        assert set(index.buckets) == {(1, 0, 0)}
+        assert set(index.buckets[(1, 0, 0)]) == {0, 1}
+        assert index.profiles[1] == (1, 0, 0)
+
+    def test_max_distance(self):
+        assert BehaviorIndex.max_distance(3, sim_thresh=0.50) == 1
+        assert BehaviorIndex.max_distance(3, sim_thresh=2 / 3) == 1
+        assert BehaviorIndex.max_distance(3, sim_thresh=0.70) == 0
+        assert BehaviorIndex.max_distance(3, sim_thresh=0) == 3
+        assert BehaviorIndex.max_distance(3, sim_thresh=1.01) == -1
+
+    def test_similar_agents(self):
+
+        # Same agents as a full scan would find, in agent list order. Few agents
+        # with many behaviors (check occupied profiles), and many agents with few
+        # behaviors (enumerate nearby profiles) take different search paths
+        for n_agents, n_beh in [(30, 10), (300, 4)]:
+            agents = [Agent(id=i, n_beh=n_beh) for i in range(n_agents)]
+            random.shuffle(agents)
+
+            index = BehaviorIndex(agents)
+
+            for sim_thresh in [0, 0.25, 0.50, 0.75, 0.90, 1]:
+                for agent in agents[0:10]:
+                    similar = index.similar_agents(agent, sim_thresh)
+                    correct = [a for a in agents if agent.similarity(a) >= sim_thresh]
+
+                    assert similar == correct
@@ -0,0 +1,89 @@
+import os
+import random
+import burn_in
+from burn_in import BurnInCache, burn_in_key, burn_in_ticks, burned_in
+
+
+class TestBurnIn:
+    def test_burn_in_key(self, monkeypatch, sim_params):
+        params = sim_params()
+        key = burn_in_key(params, burn_in_ticks(params))
+        assert burn_in_ticks(params) == 4
+
+        # intervention parameters and bookkeeping make no difference
+        other = sim_params(sim_id=7, sample_num=3, intervention={"p_enrolled": 1})
+        assert burn_in_key(other, burn_in_ticks(other)) == key
+
+        # the dynamics, the seed and the burn-in length do
+        for other in [
+            sim_params(p_emul=0.50),
+            sim_params(seed=4321),
+            sim_params(intervention={"start_tick": 5}),
+        ]:
+            assert burn_in_key(other, burn_in_ticks(other)) != key
+
+        # and so does the format of the cached states
+        monkeypatch.setattr(burn_in, "BURN_IN_FORMAT_VERSION", 2)
+        assert burn_in_key(params, burn_in_ticks(params)) != key
+
+    def test_cache_eviction(self, tmp_path):
+        cache = BurnInCache(tmp_path, max_bytes=2500)
+
+        assert cache.get("a") is None
+
+        for key in ["a", "b"]:
+            cache.put(key, bytes(1000))
+        os.utime(cache.path("a"), (0, 0))
+        os.utime(cache.path("b"), (1, 1))
+
+        # reading "a" makes "b" the least recently used
+        assert cache.get("a") == bytes(1000)
+        cache.put("c", bytes(1000))
+
+        assert sorted(os.listdir(tmp_path)) == ["a.pkl", "c.pkl"]
+
+    def test_burned_in(self, tmp_path, sim_params):
+        cache = BurnInCache(tmp_path)
+
+        # the first run fills the cache, the second starts from its burn-in
+        sims = []
+        for sim_id, p_enrolled in [(0, 0.50), (1, 1)]:
+            params = sim_params(sim_id=sim_id, intervention={"p_enrolled": p_enrolled})
+            sim = burned_in(params, burn_in_ticks(params), cache)
+            assert sim.cur_tick == 4
+
+            sims.append(sim)
+            assert len(os.listdir(tmp_path)) == 1
+
+        cached = sims[1]
+        assert cached.sim_id == 1
+        assert cached.interventions[0].p_enrolled == 1
+        assert cached.history["parameters"][0][0]["p_enrolled"] == 1
+        assert cached.history["agents"] == sims[0].history["agents"]
+
+        # which gives the same run as without the cache
+        cached.go()
+
+        # (params are the second run's)
+        random.seed(99)
+        uncached = burned_in(params, burn_in_ticks(params))
+        uncached.go()
+
+        assert cached.history["agents"] == uncached.history["agents"]
+        assert cached.history["edges"] == uncached.history["edges"]
+
+    def test_unseeded(self, tmp_path, sim_params):
+        # an unseeded burn-in is run every time, and leaves the caller's seeding
+        # of `random` alone
+        cache = BurnInCache(tmp_path)
+        params = sim_params(seed=None)
+
+        states = []
+        for _ in range(2):
+            random.seed(99)
+            sim = burned_in(params, burn_in_ticks(params), cache)
+            assert sim.cur_tick == 4
+            states.append(random.getstate())
+
+        assert os.listdir(tmp_path) == []
+        assert states[0] == states[1]
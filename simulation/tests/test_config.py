@@ -0,0 +1,66 @@
+import pytest
+from agent import Agent
+from config import SimulationConfig
+from simulation import Simulation
+
+
+class TestSimulationConfig:
+    def test_read_only(self, sim_params):
+        params = sim_params()
+        config = SimulationConfig(**params)
+
+        assert config.n_beh == 3
+        assert config["sui_ORs"] == [2, 3, 4]
+        assert "workers" not in config
+        with pytest.raises(AttributeError):
+            config.workers
+
+        with pytest.raises(AttributeError):
+            config.n_beh = 4
+
+        # the config has its own copy of the parameters
+        params["sui_ORs"].append(5)
+        assert config.sui_ORs == [2, 3, 4]
+
+        changed = config.replace(n_beh=4)
+        assert (config.n_beh, changed.n_beh) == (3, 4)
+
+    def test_row(self, sim_params):
+        config = SimulationConfig(**sim_params(start_shift=2))
+
+        row = config.row()
+        assert row["sui_ORs1"] == 3
+        assert row["tar_severity0"] == 0.40
+        assert row["p_enrolled"] == 0.50
+        assert row["effective_start_tick"] == 2
+        assert "start_shift" not in row
+        assert "intervention_params" not in row
+
+        assert config.row(flat=False)["sui_ORs"] == [2, 3, 4]
+
+        # built once, handed out as fresh dicts
+        row["tick"] = 0
+        assert "tick" not in config.row()
+
+    def test_risk_coefs(self, sim_params):
+        config = SimulationConfig(**sim_params(gen_ave_beh=1))
+        assert config.risk_coefs is config.risk_coefs
+
+        agent = Agent(id=0, n_beh=3)
+        risk = agent.suicide_risk([2, 3, 4], 1 / 100, 1)
+        assert agent.suicide_risk(None, None, None, config.risk_coefs) == risk
+
+
+class TestSimulationParameters:
+    def test_parameters(self):
+        sim = Simulation(ticks=10, n_beh=2, seed=5)
+
+        assert sim.seed == 5
+        assert sim.total_ticks == 10
+        assert getattr(sim, "sim_id", None) is None
+
+        with pytest.raises(AttributeError):
+            sim.seed = 6
+
+        sim.config = sim.config.replace(seed=6)
+        assert sim.seed == 6
@@ -0,0 +1,80 @@
+import random
+from burn_in import BurnInCache, burn_in_ticks, burned_in
+from convergence import ConvergenceMonitor
+from simulation import Simulation
+
+# Converges after a handful of ticks, long before the intervention
+CONVERGING = {
+    "ticks": 50,
+    "converge_window": 3,
+    "converge_tol": 0.50,
+    "converge_margin": 2,
+    "intervention": {"start_tick": 40, "duration": 5},
+}
+
+
+class TestConvergenceMonitor:
+    def test_observe(self):
+        monitor = ConvergenceMonitor(window=2, tol=0.10)
+
+        # a trend, then a plateau
+        for tick, level in enumerate([0.0, 0.2, 0.4, 0.6, 0.6, 0.6]):
+            converged = monitor.observe(tick, [level, float("nan")])
+            assert converged == (tick == 5)
+
+        assert monitor.converged_tick == 5
+        assert monitor.observe(6, [1.0, 1.0])
+        assert monitor.converged_tick == 5
+
+
+class TestConvergedStart:
+    def test_shift_start(self, sim_params):
+        random.seed(1234)
+        sim = Simulation(**sim_params(**CONVERGING))
+        sim.setup()
+        sim.go()
+
+        # converged once two windows were seen, after 5 ticks
+        assert sim.convergence.converged_tick == 5
+        assert sim.start_shift == 33
+        assert sim.interventions[0].start_tick == 7
+        assert sim.interventions[0].last_tick == 11
+        assert sim.interventions[0].beh_changed > 0
+
+        assert sim.total_ticks == 17
+        assert len(sim.history["agents"]) == 18
+        for intv_dicts in sim.history["interventions"]:
+            assert intv_dicts[0]["start_tick"] == 7
+
+        params = sim.history_for_db()["parameters"][0]
+        assert params["start_tick"] == 40
+        assert params["effective_start_tick"] == 7
+        assert params["converge_window"] == 3
+        assert "convergence" not in params
+
+    def test_no_convergence(self, sim_params):
+        random.seed(1234)
+        sim = Simulation(**sim_params(**dict(CONVERGING, converge_tol=1e-9)))
+        sim.setup()
+        sim.go()
+
+        assert sim.convergence.converged_tick is None
+        assert sim.total_ticks == 50
+        assert sim.history_for_db()["parameters"][0]["effective_start_tick"] == 40
+
+    def test_cached_burn_in(self, tmp_path, sim_params):
+        cache = BurnInCache(tmp_path)
+        params = sim_params(**CONVERGING)
+
+        sims = []
+        for _ in range(2):
+            random.seed(99)
+            sim = burned_in(params, burn_in_ticks(params), cache)
+            assert sim.cur_tick == 7
+            assert sim.interventions[0].start_tick == 7
+
+            sim.go()
+            sims.append(sim)
+
+        assert sims[0].history["agents"] == sims[1].history["agents"]
+        assert sims[1].total_ticks == 17
@@ -1,6 +1,7 @@
 import copy
 import random
 from intervention import (
+    random_pairs,
     Intervention,
     MockInterventionA,
     MockInterventionB,
@@ -8,9 +9,30 @@ from intervention import (
     IndividualIntervention,
 )
 import igraph as ig
+import numpy as np
 from agent import Agent
 
 
+class TestRandomPairs:
+    def test_random_pairs(self):
+        rng = np.random.default_rng()
+
+        assert random_pairs(10, 0, rng).shape == (0, 2)
+        assert random_pairs(1, 1, rng).shape == (0, 2)
+
+        # p = 1 gives every pair exactly once
+        pairs = random_pairs(5, 1, rng).tolist()
+        correct_pairs = [[i, j] for j in range(5) for i in range(j)]
+        assert pairs == correct_pairs
+
+        # only valid, distinct pairs, at about the expected density
+        pairs = random_pairs(200, 0.10, rng)
+        assert all(pairs[:, 0] < pairs[:, 1])
+        assert pairs.min() >= 0 and pairs.max() < 200
+        assert len(set(map(tuple, pairs.tolist()))) == len(pairs)
+        assert 1790 < len(pairs) < 2190
+
+
 class TestIntervention:
     def test_init_(self):
         params = {
@@ -162,6 +184,74 @@ class TestIntervention:
 
         assert set(intv.enrolled_names) == set(enrolled_names)
 
+    def test_remove_random_edges(self):
+        intv_params = {
+            "intv_class_name": "Intervention",
+            "start_tick": 5,
+            "duration": 3,
+            "tar_severity": [0.50, 0.75],
+            "p_rewire": 0.25,
+            "p_enrolled": 0.50,
+            "p_beh_change": 0.50,
+        }
+
+        intv = Intervention(**intv_params)
+
+        network = ig.Graph.Full(n=40)
+        network.vs["name"] = [f"id_{i}" for i in range(40)]
+        old_es = [
+            (e.source_vertex["name"], e.target_vertex["name"]) for e in network.es
+        ]
+
+        intv.remove_random_edges(network, p=0)
+        assert network.ecount() == len(old_es)
+
+        # about half of the 780 edges removed, and nothing added
+        intv.remove_random_edges(network, p=0.50)
+        new_es = [
+            (e.source_vertex["name"], e.target_vertex["name"]) for e in network.es
+        ]
+        assert set(new_es) < set(old_es)
+        assert 290 < len(new_es) < 490
+        assert network.vcount() == 40
+
+        intv.remove_random_edges(network, p=1)
+        assert network.ecount() == 0
+
+    def test_enrollment_mask(self):
+        intv_params = {
+            "intv_class_name": "Intervention",
+            "start_tick": 5,
+            "duration": 3,
+            "tar_severity": [0.50, 0.75],
+            "p_rewire": 0.25,
+            "p_enrolled": 0.50,
+            "p_beh_change": 0.50,
+        }
+
+        intv = Intervention(**intv_params)
+
+        agents = [Agent(id=i, n_beh=3) for i in range(4)]
+        for agent in agents:
+            agent.beh = [agent.id] * 3
+
+        # agents are out of order, as they are after a simulation tick
+        agents = [agents[2], agents[0], agents[3], agents[1]]
+
+        intv.enroll([agents[0], agents[3]], agents)
+
+        assert intv.enrolled_names == ["id_2", "id_1"]
+        assert intv.enrolled_mask.tolist() == [False, True, True, False]
+        assert [a.enrolled for a in agents] == [True, False, False, True]
+
+        # rows of the behavior matrix are indexed by agent id
+        beh = intv.behavior_matrix(agents)
+        assert beh.tolist() == [[0, 0, 0], [1, 1, 1], [2, 2, 2], [3, 3, 3]]
+
+        # default intervention changes nothing
+        intv.intervene(agents, network="placeholder")
+        assert [a.beh for a in agents] == [[2] * 3, [0] * 3, [3] * 3, [1] * 3]
+
 
 class TestNetworkIntervention:
     def test_setup(self):
@@ -300,10 +390,9 @@ class TestNetworkIntervention:
 
         new_es = [e.tuple for e in network.es]
 
-        # Some edges should be rewired, but probably not all
-        matching_edges = [old == new for old, new in zip(old_es, new_es)]
-        assert any(matching_edges)
-        assert not all(matching_edges)
+        # Some edges should be added, but none removed or duplicated
+        assert set(old_es) < set(new_es)
+        assert len(set(new_es)) == len(new_es)
 
         # Calculate all the changes produced by intv and where they occured
         tar_changes = []
@@ -444,6 +533,46 @@ class TestIndividualIntervention:
 
         assert intv.priority_behaviors(agent) == correct_priorities
 
+    def test_top_k_rows(self):
+        scores = np.array([3.0, 1.0, 5.0, 3.0, 0.0, 3.0])
+
+        # ties are broken in favor of later rows, as in prioritize_agents()
+        assert IndividualIntervention.top_k_rows(scores, 1).tolist() == [2]
+        assert IndividualIntervention.top_k_rows(scores, 2).tolist() == [2, 5]
+        assert IndividualIntervention.top_k_rows(scores, 4).tolist() == [2, 5, 3, 0]
+        assert IndividualIntervention.top_k_rows(scores, 0).tolist() == []
+
+        ranked = IndividualIntervention.top_k_rows(scores, 10).tolist()
+        assert ranked == [2, 5, 3, 0, 1, 4]
+
+    def test_treatable_mask(self):
+        intv_params = {
+            "intv_class_name": "IndividualIntervention",
+            "start_tick": 5,
+            "duration": 3,
+            "tar_severity": [0.25, 0.75],
+            "p_rewire": 0.25,
+            "p_enrolled": 0.50,
+            "p_beh_change": 0.50,
+        }
+
+        intv = IndividualIntervention(**intv_params)
+
+        agents = [Agent(id=i, n_beh=5) for i in range(3)]
+        agents[0].beh = [1, 0, 1, 1, 1]
+        agents[1].beh = [0, 0, 0, 0, 0]
+        agents[2].beh = [1, 1, 1, 1, 1]
+
+        intv.setup(agents, network="placeholder", sui_ORs=[2, 12, 11, 3, 3])
+        assert intv.treatable_beh == 3
+
+        mask = intv.treatable_mask(np.array([a.beh for a in agents]))
+
+        # agrees with the first treatable_beh priority behaviors of each agent
+        for agent, row in zip(agents, mask):
+            treatable = intv.priority_behaviors(agent)[0 : intv.treatable_beh]
+            assert sorted(treatable) == np.flatnonzero(row).tolist()
+
     def test_intervene(self):
 
         # Network
@@ -615,6 +744,29 @@ class TestMockInterventionA:
         assert any(enrolled_changes)
         assert any([sum(a.beh) == 0 for a in enrolled])
 
+    def test_intervene_masked(self):
+        intv_params = {
+            "intv_class_name": "MockInterventionA",
+            "start_tick": 5,
+            "duration": 3,
+            "tar_severity": [0.50, 0.75],
+            "p_rewire": 0.50,
+            "p_enrolled": 0.50,
+            "p_beh_change": 1,
+        }
+
+        intv = MockInterventionA(**intv_params)
+
+        beh = np.ones((6, 4), dtype=int)
+        enrolled = np.array([True, False, True, False, False, True])
+
+        intv.intervene_masked(beh, enrolled, network="placeholder")
+
+        # every enrollee becomes risk free, no one else changes
+        assert not beh[enrolled].any()
+        assert beh[~enrolled].all()
+        assert intv.beh_changed == 12
+
 
 class TestMockInterventionB:
     def test_setup(self):
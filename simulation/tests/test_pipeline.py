@@ -0,0 +1,86 @@
+import multiprocessing as mp
+import os
+import pytest
+import pipeline as pipeline_module
+from pipeline import ResultPipeline, spill, unspill
+from simulation import Simulation
+
+
+def failing_writer(queue):
+    # Takes one simulation, then fails before acknowledging it
+    queue.get()
+    raise SystemExit(3)
+
+
+class TestResultPipeline:
+    def test_spill(self, tmp_path):
+        sim = Simulation(ticks=1, sim_id=3)
+
+        path = spill(sim, tmp_path)
+        assert os.path.exists(path)
+
+        loaded, spilled = unspill(path)
+        assert spilled
+        assert loaded.sim_id == 3
+        assert not os.path.exists(path)
+
+        assert unspill(sim) == (sim, False)
+
+    def test_put(self, tmp_path):
+        pipeline = ResultPipeline(max_pending=3, queue_size=1, spill_dir=tmp_path)
+
+        for sim_id in range(3):
+            pipeline.reserve()
+            pipeline.put(Simulation(ticks=1, sim_id=sim_id))
+
+        # the queue holds one simulation, the others wait on disk with their
+        # slots freed
+        assert pipeline.n_spilled == 2
+        assert len(os.listdir(tmp_path)) == 2
+        pipeline.reserve()
+        pipeline.reserve()
+
+        # the writer takes the first simulation, making room for a spilled one
+        first, spilled = unspill(pipeline.queue.get())
+        assert (first.sim_id, spilled) == (0, False)
+        pipeline.acks.put((first.sim_id, spilled))
+
+        second, spilled = unspill(pipeline.queue.get())
+        assert (second.sim_id, spilled) == (1, True)
+        pipeline.acks.put((second.sim_id, spilled))
+
+        third, spilled = unspill(pipeline.queue.get())
+        assert (third.sim_id, spilled) == (2, True)
+
+        pipeline.close()
+        assert pipeline.queue.get() is None
+
+        pipeline.acks.put((third.sim_id, spilled))
+        pipeline.acks.put(None)
+        pipeline.join()
+
+        assert pipeline.written == 3
+        assert not os.listdir(tmp_path)
+
+    def test_writer_exits(self, monkeypatch):
+        monkeypatch.setattr(pipeline_module, "WRITER_POLL", 0.05)
+
+        pipeline = ResultPipeline(max_pending=2, queue_size=1)
+        writer = mp.Process(target=failing_writer, args=(pipeline.queue,))
+        writer.start()
+        pipeline.watch(writer)
+
+        for sim_id in range(2):
+            pipeline.reserve()
+            pipeline.put(Simulation(ticks=1, sim_id=sim_id))
+        writer.join()
+
+        # no slot is ever freed, and the caller hears why instead of waiting
+        with pytest.raises(RuntimeError, match="exit code 3"):
+            pipeline.reserve()
+
+        # the queue stays full, and the last acknowledgement never comes
+        with pytest.raises(RuntimeError, match="exit code 3"):
+            pipeline.close()
+        with pytest.raises(RuntimeError, match="exit code 3"):
+            pipeline.join()
@@ -0,0 +1,78 @@
+import os
+import random
+from profiling import merge_profiles, prepare_profile_dir, profiled_run
+from simulation import Simulation
+
+
+def run_small_simulation(sim_id, ticks=3):
+    sim = Simulation(
+        ticks=ticks,
+        n_agents=20,
+        n_beh=3,
+        baserates=[0.50, 0.50, 0.50],
+        sui_ORs=[2, 3, 4],
+        p_edge=0.20,
+        p_emul=0.25,
+        p_spon_change=0.25,
+        sim_thresh=0.50,
+        gen_sui_prev=1 / 10,
+        gen_ave_beh=0,
+        sim_id=sim_id,
+        intervention_params=[
+            {
+                "intv_class_name": "MockInterventionA",
+                "start_tick": 1,
+                "duration": 1,
+                "tar_severity": [0.40, 1],
+                "p_rewire": 0,
+                "p_enrolled": 1,
+                "p_beh_change": 1,
+            }
+        ],
+    )
+    sim.setup()
+    sim.go()
+
+    return sim
+
+
+class TestProfiling:
+    def test_profiled_run(self, tmp_path):
+        profile_dir = str(tmp_path / "profiles")
+        prepare_profile_dir(profile_dir)
+
+        random.seed(1234)
+        sim = profiled_run(run_small_simulation, profile_dir, 3, ticks=2)
+        assert sim.sim_id == 3
+        assert sim.cur_tick == 2
+
+        assert os.listdir(profile_dir) == [f"sim_3_pid_{os.getpid()}.prof"]
+
+        # a fresh run starts from an empty directory
+        prepare_profile_dir(profile_dir)
+        assert os.listdir(profile_dir) == []
+
+    def test_merge_profiles(self, tmp_path, capsys):
+        profile_dir = str(tmp_path / "profiles")
+        prepare_profile_dir(profile_dir)
+        out_path = str(tmp_path / "workers.prof")
+
+        assert merge_profiles(profile_dir, out_path) is None
+
+        random.seed(1234)
+        for sim_id in range(2):
+            profiled_run(run_small_simulation, profile_dir, sim_id)
+
+        stats = merge_profiles(profile_dir, out_path, top_n=5)
+        assert os.path.exists(out_path)
+        assert "merged 2 worker profiles" in capsys.readouterr().out
+
+        # stats are keyed by (file, line, function), with the calls of both runs
+        calls = {}
+        for (path, _, func), (_, n_calls, *_) in stats.stats.items():
+            if os.path.basename(path) == "simulation.py":
+                calls[func] = n_calls
+
+        assert calls["setup"] == 2
+        assert calls["tick"] == 2 * 3
+        assert calls["record_history"] == 2 * (3 + 1)
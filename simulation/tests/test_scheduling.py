@@ -0,0 +1,83 @@
+import json
+from math import log
+from scheduling import CostModel, cost_features, schedule
+
+
+class TestCostModel:
+    def test_fit(self):
+        # tick time = n_agents ** 2 * p_edge / 1000
+        observations = []
+        for n_agents in [5, 10, 50, 100]:
+            for p_edge in [0.1, 0.5]:
+                features = cost_features(n_agents, p_edge, 10, 0.8)
+                observations.append((features, n_agents**2 * p_edge / 1000))
+
+        model = CostModel.fit(observations)
+        assert model.n_observations == 8
+
+        params = {"n_agents": 20, "p_edge": 0.25, "n_beh": 10, "sim_thresh": 0.8}
+        assert abs(model.tick_cost(params) - 0.1) < 1e-6
+        assert abs(model.predict(dict(params, ticks=50)) - 5) < 1e-4
+
+    def test_default(self, tmp_path):
+        model = CostModel.from_files([tmp_path / "missing.json"])
+        assert model.n_observations == 0
+
+        small = {"n_agents": 5, "p_edge": 0.5, "n_beh": 10, "sim_thresh": 0.8}
+        big = dict(small, n_agents=30)
+        assert model.tick_cost(big) > model.tick_cost(small)
+
+    def test_from_files(self, tmp_path):
+        metrics = {
+            "ensemble": {},
+            "simulations": [
+                {
+                    "n_agents": n,
+                    "p_edge": 0.5,
+                    "n_beh": 10,
+                    "sim_thresh": 0.7,
+                    "ticks": 10,
+                    "tick_time": 10 * n / 100,
+                }
+                for n in [4, 8, 16, 32]
+            ],
+        }
+        benchmark = {
+            "meta": {},
+            "results": [
+                {"n_agents": 64, "p_edge": 0.5, "n_beh": 10, "tick": {"median_s": 0.64}}
+            ],
+        }
+
+        paths = [tmp_path / "metrics.json", tmp_path / "benchmark.json"]
+        for path, report in zip(paths, [metrics, benchmark]):
+            with open(path, "w") as f:
+                json.dump(report, f)
+
+        model = CostModel.from_files(paths)
+        assert model.n_observations == 5
+
+        params = {"n_agents": 20, "p_edge": 0.5, "n_beh": 10, "sim_thresh": 0.7}
+        assert abs(log(model.tick_cost(params)) - log(0.2)) < 0.05
+
+
+class TestSchedule:
+    def test_schedule(self):
+        costs = [1, 100, 2, 50, 1, 1, 3, 1]
+        chunks = schedule(costs, processes=2, chunks_per_process=4)
+
+        # every job once, most expensive first
+        assert sorted(sum(chunks, [])) == list(range(len(costs)))
+        assert chunks[0] == [1]
+        assert chunks[1] == [3]
+
+        first_costs = [costs[chunk[0]] for chunk in chunks]
+        assert first_costs == sorted(first_costs, reverse=True)
+
+        # cheap jobs are batched
+        assert len(chunks) < len(costs)
+
+    def test_max_chunk(self):
+        chunks = schedule([1] * 10, processes=1, chunks_per_process=1, max_chunk=3)
+
+        assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
@@ -1,4 +1,10 @@
 import copy
+import igraph as ig
+import pytest
+import random
+import sqlite3
+import tracemalloc
+from statistics import mean
 from agent import Agent
 from simulation import Simulation
 
@@ -209,3 +215,524 @@ class TestSimulation:
 
         # number of ticks from params, plus 1 for setup
         assert len(sim.history["agents"]) == 31
+
+    def test_validation_levels(self):
+        params = {
+            "ticks": 6,
+            "n_agents": 10,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.50,
+            "p_emul": 0.50,
+            "p_spon_change": 0.50,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "intervention_params": [
+                {
+                    "intv_class_name": "NetworkIntervention",
+                    "start_tick": 2,
+                    "duration": 1,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0.25,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                },
+            ],
+        }
+
+        # setup + (before and after each tick) + (before and after go)
+        correct_counts = {"off": 0, "setup": 1, "periodic": 4, "paranoid": 15}
+
+        for level, correct_count in correct_counts.items():
+            sim = Simulation(validation=level, validate_every=2, **params)
+
+            calls = []
+            validate = sim.validate
+            sim.validate = lambda: calls.append(sim.cur_tick) or validate()
+
+            sim.setup()
+            sim.go()
+
+            assert len(calls) == correct_count
+            assert len(sim.history["agents"]) == params["ticks"] + 1
+
+            # runtime options are not model parameters
+            assert "validation" not in sim.params_to_dict()[0]
+
+    def test_metrics(self):
+        params = {
+            "ticks": 5,
+            "n_agents": 10,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.50,
+            "p_emul": 0.50,
+            "p_spon_change": 0.50,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "intervention_params": [
+                {
+                    "intv_class_name": "MockInterventionB",
+                    "start_tick": 5,
+                    "duration": 1,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0.25,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                },
+            ],
+        }
+
+        # off by default
+        sim = Simulation(**params)
+        assert sim.metrics is None
+
+        sim = Simulation(metrics=True, **params)
+        sim.setup()
+        old_n_edges = len(sim.network.es)
+        sim.go()
+
+        metrics = sim.metrics.as_dict()
+        assert metrics["n_simulations"] == 1
+        assert metrics["ticks"] == params["ticks"]
+        assert metrics["setup_time"] > 0
+        assert metrics["recruit_time"] > 0
+        assert metrics["tick_time"] >= sum(sim.metrics.phase_times.values())
+
+        # the intervention never becomes active, so agents make every edge change
+        n_edge_changes = metrics["edges_added"] - metrics["edges_removed"]
+        assert n_edge_changes == len(sim.network.es) - old_n_edges
+        assert metrics["alter_lookups"] == 3 * params["ticks"] * params["n_agents"]
+        assert metrics["similarity_evals"] > 0
+
+        # metrics from several simulations can be pooled
+        pooled = copy.deepcopy(sim.metrics).merge(sim.metrics).as_dict()
+        assert pooled["n_simulations"] == 2
+        assert pooled["edges_added"] == 2 * metrics["edges_added"]
+
+    def test_memory_reports(self):
+        params = {
+            "ticks": 4,
+            "n_agents": 10,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.50,
+            "p_emul": 0.50,
+            "p_spon_change": 0.50,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "intervention_params": [
+                {
+                    "intv_class_name": "MockInterventionA",
+                    "start_tick": 2,
+                    "duration": 1,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0.25,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                },
+            ],
+        }
+
+        sim = Simulation(**params)
+        sim.setup()
+        sim.go()
+        assert not sim.memory_reports
+
+        sim = Simulation(memory_ticks=[0, 3], **params)
+        sim.setup()
+        sim.go()
+
+        assert [r["tick"] for r in sim.memory_reports] == [0, 3]
+        for report in sim.memory_reports:
+            assert report["traced_current"] > 0
+            assert report["live_agents"] > 0
+            assert report["live_network"] > 0
+
+        # history only grows
+        first, last = sim.memory_reports
+        assert last["history_agents"] > first["history_agents"]
+        assert last["history_networks"] > first["history_networks"]
+
+        # tracing is switched off again once the simulation is done
+        assert not tracemalloc.is_tracing()
+
+        con = sqlite3.connect(":memory:")
+        sim.insert_memory_to_db(con)
+        assert con.execute("SELECT COUNT(*) FROM memory").fetchone()[0] == 2
+
+    def test_indexed_recruitment(self):
+        params = {
+            "ticks": 8,
+            "n_agents": 20,
+            "n_beh": 4,
+            "baserates": [0.50, 0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4, 5],
+            "p_edge": 0.20,
+            "p_emul": 0.50,
+            "p_spon_change": 0.50,
+            "sim_thresh": 0.70,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "seed": 1234,
+            "intervention_params": [
+                {
+                    "intv_class_name": "IndividualIntervention",
+                    "start_tick": 3,
+                    "duration": 2,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0.25,
+                    "p_enrolled": 0.50,
+                    "p_beh_change": 0.50,
+                },
+            ],
+        }
+
+        # the index only narrows the search, so runs with the same random
+        # numbers end up with exactly the same history
+        histories = []
+        for recruitment in ["scan", "indexed"]:
+            random.seed(params["seed"])
+
+            sim = Simulation(recruitment=recruitment, **params)
+            sim.setup()
+            sim.go()
+
+            histories.append(sim.history)
+
+        assert histories[0]["agents"] == histories[1]["agents"]
+        assert histories[0]["edges"] == histories[1]["edges"]
+        assert any([tick_edges for tick_edges in histories[0]["edges"]])
+
+    def test_sampled_recruitment(self):
+        params = {
+            "ticks": 5,
+            "n_agents": 30,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.10,
+            "p_emul": 0.50,
+            "p_spon_change": 0.50,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "recruit_k": 2,
+            "intervention_params": [
+                {
+                    "intv_class_name": "MockInterventionA",
+                    "start_tick": 2,
+                    "duration": 1,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0.25,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                },
+            ],
+        }
+
+        sim = Simulation(recruitment="sampled", **params)
+        sim.setup()
+
+        for _ in range(params["ticks"]):
+            sim.tick()
+
+            assert all([a.recruit_candidates <= 2 for a in sim.agents])
+            assert all([a.recruited_alters <= 2 for a in sim.agents])
+            assert not sim.network.has_multiple()
+
+        # recruit_k is part of the model, so it is recorded with the parameters
+        assert sim.params_to_dict()[0]["recruit_k"] == 2
+
+    def test_fork(self):
+        intervention = {
+            "intv_class_name": "MockInterventionA",
+            "start_tick": 4,
+            "duration": 2,
+            "tar_severity": [0.40, 1],
+            "p_rewire": 0,
+            "p_enrolled": 1,
+            "p_beh_change": 1,
+        }
+        params = {
+            "ticks": 8,
+            "n_agents": 20,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.20,
+            "p_emul": 0.50,
+            "p_spon_change": 0.50,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 100,
+            "gen_ave_beh": 0,
+            "seed": 1234,
+            "sim_id": 7,
+            "intervention_params": [intervention],
+        }
+
+        random.seed(1234)
+        trunk = Simulation(**params)
+        trunk.setup()
+        trunk.run_until(4)
+        assert trunk.cur_tick == 4
+
+        # an arm whose intervention never starts
+        late = dict(intervention, start_tick=8, duration=1)
+        arms = {"control": None, "treated": [intervention], "late": [late]}
+        branches = trunk.fork(arms, sim_ids=[70, 71, 72])
+
+        for branch in branches:
+            branch.reseed()
+            branch.go()
+
+        control, treated, late_branch = branches
+        assert [b.branch for b in branches] == ["control", "treated", "late"]
+        assert control.interventions == []
+        assert treated.interventions[0].beh_changed > 0
+
+        # shared burn-in
+        for branch in branches:
+            assert len(branch.history["agents"]) == 9
+            for tick in range(5):
+                assert branch.history["edges"][tick] == trunk.history["edges"][tick]
+
+        # common random numbers: without an active intervention, a branch is
+        # the control
+        assert control.history["agents"] == late_branch.history["agents"]
+        assert control.history["agents"] != treated.history["agents"]
+
+        params_row = treated.history_for_db()["parameters"][0]
+        assert params_row["sim_id"] == 71
+        assert params_row["trunk_id"] == 7
+        assert params_row["fork_tick"] == 4
+        assert params_row["branch"] == "treated"
+        assert "crn_seed" not in params_row
+
+        # the control records no intervention, in the treated branches' columns
+        control_row = control.history_for_db()["parameters"][0]
+        assert set(control_row) == set(params_row)
+        assert control_row["branch"] == "control"
+        assert control_row["intv_class_name"] is None
+        assert control_row["p_enrolled"] is None
+        assert control_row["tar_severity0"] is None
+        assert control_row["effective_start_tick"] is None
+        assert "without_interventions" not in control_row
+
+    def test_outcomes(self):
+        params = {
+            "ticks": 12,
+            "n_agents": 30,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.20,
+            "p_emul": 0.25,
+            "p_spon_change": 0.25,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 10,
+            "gen_ave_beh": 0,
+            "sim_id": 3,
+            "intervention_params": [
+                {
+                    "intv_class_name": "MockInterventionA",
+                    "start_tick": 4,
+                    "duration": 2,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                }
+            ],
+        }
+
+        random.seed(1234)
+        sim = Simulation(**params)
+        sim.setup()
+        sim.go()
+
+        history = sim.history_for_db()
+        outcomes = history["outcomes"]
+        assert len(outcomes) == 13
+        assert outcomes[0]["expected_attempts"] == 0
+
+        # each tick's outcomes against its agents
+        for tick_agents, tick_outcomes in zip(sim.history["agents"], outcomes):
+            risks = [a["cur_risk"] for a in tick_agents]
+            assert tick_outcomes["expected_attempts"] == pytest.approx(sum(risks))
+            assert tick_outcomes["attempts"] == sum(
+                [a["cur_attempt"] for a in tick_agents]
+            )
+
+        summary = history["outcome_summary"]
+        assert len(summary) == 1
+        summary = summary[0]
+        assert summary["sim_id"] == 3
+        assert summary["ticks"] == 12
+        assert summary["ticks_from_start"] == 8
+        assert summary["agent_ticks"] == 12 * 30
+        assert summary["attempts"] == sum([a.attempts for a in sim.agents])
+        assert summary["expected_attempts"] == pytest.approx(
+            sum([o["expected_attempts"] for o in outcomes])
+        )
+        assert summary["expected_attempts_from_start"] == pytest.approx(
+            sum([o["expected_attempts"] for o in outcomes[5:]])
+        )
+        assert summary["expected_attempt_rate"] == pytest.approx(
+            summary["expected_attempts"] / (12 * 30)
+        )
+
+        with sqlite3.connect(":memory:") as con:
+            sim.create_history_tables(con)
+            sim.insert_history_to_db(con)
+            rows = con.execute("SELECT * FROM outcome_summary").fetchall()
+            assert len(rows) == 1
+
+            # the tables hold the rows of history_for_db()
+            con.row_factory = sqlite3.Row
+            for aspect in ["agents", "edges", "parameters"]:
+                rows = con.execute(f"SELECT * FROM {aspect}").fetchall()
+                assert [dict(row) for row in rows] == history[aspect]
+
+        # exporting tags the rows, not the history
+        assert "tick" not in sim.history["agents"][0][0]
+        assert "sim_id" not in sim.history["edges"][0][0]
+        assert history["agents"][-1]["tick"] == 12
+        assert history["agents"][-1]["sim_id"] == 3
+
+    def test_aggregate_recording(self):
+        params = {
+            "ticks": 6,
+            "n_agents": 30,
+            "n_beh": 3,
+            "baserates": [0.50, 0.50, 0.50],
+            "sui_ORs": [2, 3, 4],
+            "p_edge": 0.20,
+            "p_emul": 0.25,
+            "p_spon_change": 0.25,
+            "sim_thresh": 0.50,
+            "gen_sui_prev": 1 / 10,
+            "gen_ave_beh": 0,
+            "sim_id": 3,
+            "intervention_params": [
+                {
+                    "intv_class_name": "MockInterventionA",
+                    "start_tick": 2,
+                    "duration": 2,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                }
+            ],
+        }
+
+        sims = {}
+        for recording in ["full", "aggregate"]:
+            random.seed(1234)
+            sims[recording] = Simulation(recording=recording, **params)
+            sims[recording].setup()
+            sims[recording].go()
+
+        full = sims["full"].history_for_db()
+        aggregate = sims["aggregate"].history_for_db()
+        assert set(aggregate) == {
+            "aggregates",
+            "interventions",
+            "parameters",
+            "outcome_summary",
+        }
+        assert "recording" not in aggregate["parameters"][0]
+
+        # one row per tick, with the same population-level series
+        rows = aggregate["aggregates"]
+        assert len(rows) == 7
+        for tick, row in enumerate(rows):
+            for key, val in full["networks"][tick].items():
+                assert row[key] == pytest.approx(val, nan_ok=True)
+            for key, val in full["outcomes"][tick].items():
+                assert row[key] == pytest.approx(val)
+
+            tick_agents = [a for a in full["agents"] if a["tick"] == tick]
+            assert row["prevalence_beh1"] == pytest.approx(
+                mean([a["beh1"] for a in tick_agents])
+            )
+
+        assert aggregate["outcome_summary"] == full["outcome_summary"]
+
+        with sqlite3.connect(":memory:") as con:
+            sims["aggregate"].create_history_tables(con)
+            sims["aggregate"].insert_history_to_db(con)
+            assert con.execute("SELECT COUNT(*) FROM aggregates").fetchone() == (7,)
+
+    def test_assortativity_by_vertex(self):
+        # the agent list is shuffled every tick, the vertices are not
+        random.seed(1234)
+        sim = Simulation(
+            ticks=1,
+            n_agents=30,
+            n_beh=3,
+            p_edge=0.20,
+            sui_ORs=[2, 3, 4],
+            baserates=[0.50, 0.50, 0.50],
+            intervention_params=[
+                {
+                    "intv_class_name": "MockInterventionA",
+                    "start_tick": 1,
+                    "duration": 1,
+                    "tar_severity": [0.40, 1],
+                    "p_rewire": 0,
+                    "p_enrolled": 1,
+                    "p_beh_change": 1,
+                }
+            ],
+        )
+        sim.setup()
+        random.shuffle(sim.agents)
+
+        agents_by_id = {a.id: a for a in sim.agents}
+        behs = [agents_by_id[v.index].beh[0] for v in sim.network.vs]
+        assort = sim.network.assortativity(types1=behs, directed=False)
+
+        assert sim.network_to_dict()[0]["assort_beh0"] == pytest.approx(assort)
+
+    def test_edge_export(self):
+        random.seed(1234)
+        sim = Simulation(
+            ticks=1,
+            n_agents=30,
+            n_beh=3,
+            p_edge=0.20,
+            sui_ORs=[2, 3, 4],
+            baserates=[0.50, 0.50, 0.50],
+            intervention_params=[],
+        )
+        sim.network = ig.Graph.Erdos_Renyi(n=30, p=0.20)
+        sim.network.vs["name"] = [f"id_{i}" for i in range(30)]
+
+        expected = [
+            {
+                "src_index": edge.source,
+                "src_name": edge.source_vertex["name"],
+                "tar_index": edge.target,
+                "tar_name": edge.target_vertex["name"],
+            }
+            for edge in sim.network.es
+        ]
+        assert sim.edges_to_dict() == expected
+
+        columns = sim.edges_to_arrays()
+        assert all([len(col) == sim.network.ecount() for col in columns.values()])
+        assert columns["tar_name"][0] == expected[0]["tar_name"]
+
+        verts = sim.verts_to_dict()
+        assert verts[3] == {"index": 3, "name": "id_3"}
+
+        sim.network.delete_edges(sim.network.es)
+        assert sim.edges_to_dict() == []
@@ -0,0 +1,84 @@
+import random
+import sqlite3
+import numpy as np
+import pytest
+from simulation import Simulation
+from summary import EnsembleSummary, RunningStats
+
+
+class TestRunningStats:
+    def test_add(self):
+        values = np.random.default_rng(1).normal(size=(50, 3))
+        values[[3, 10, 11], 2] = np.nan
+
+        stats = RunningStats(3)
+        for row in values:
+            stats.add(row)
+
+        assert stats.n.tolist() == [50, 50, 47]
+        assert stats.mean == pytest.approx(np.nanmean(values, axis=0))
+        assert stats.variance() == pytest.approx(np.nanvar(values, axis=0, ddof=1))
+
+        assert np.isnan(RunningStats(1).variance()).all()
+
+
+class TestEnsembleSummary:
+    def test_add(self, sim_params):
+        random.seed(1234)
+
+        sims = []
+        for sim_id, intv_class_name in enumerate(
+            ["MockInterventionA", "MockInterventionA", "MockInterventionB"]
+        ):
+            for recording in ["full", "aggregate"]:
+                params = sim_params(
+                    ticks=4,
+                    seed=None,
+                    sim_id=sim_id,
+                    intervention={"intv_class_name": intv_class_name, "start_tick": 2},
+                )
+                sim = Simulation(recording=recording, **params)
+                sim.setup()
+                sim.go()
+                sims.append(sim)
+
+        summary = EnsembleSummary(group_by=["intv_class_name"])
+        for sim in sims:
+            summary.add(sim)
+        assert summary.n_simulations == 6
+
+        rows = summary.rows()
+        assert set(rows[0]) == {
+            "intv_class_name",
+            "tick",
+            "variable",
+            "n",
+            "mean",
+            "variance",
+        }
+
+        # both recordings give the same series
+        full_series = sims[0].population_series()
+        aggregate_series = sims[1].population_series()
+        assert set(full_series[0]) == set(aggregate_series[0])
+
+        # against the series of the group's simulations
+        group = sims[:4]
+        for tick in range(5):
+            values = [s.population_series()[tick]["expected_attempts"] for s in group]
+            row = [
+                r
+                for r in rows
+                if r["intv_class_name"] == "MockInterventionA"
+                and r["tick"] == tick
+                and r["variable"] == "expected_attempts"
+            ][0]
+
+            assert row["n"] == 4
+            assert row["mean"] == pytest.approx(np.mean(values))
+            assert row["variance"] == pytest.approx(np.var(values, ddof=1))
+
+        with sqlite3.connect(":memory:") as con:
+            assert summary.insert_to_db(con) == len(rows)
+            n_rows = con.execute("SELECT COUNT(*) FROM summary").fetchone()[0]
+            assert n_rows == len(rows)
@@ -0,0 +1,176 @@
+import random
+import synchronous
+from itertools import combinations
+import numpy as np
+from intervention import Intervention
+from models import build_simulation
+from simulation import Simulation
+from synchronous import (
+    SynchronousSimulation,
+    adjacency,
+    distinct_draws,
+    profile_groups,
+    ragged_ranges,
+    sample_non_neighbors,
+)
+
+
+class TestSynchronousSimulation:
+    def test_build_simulation(self, sim_params):
+        sim = build_simulation(**sim_params())
+        assert type(sim) is Simulation
+        assert sim.model == "sequential"
+
+        sim = build_simulation(model="synchronous", **sim_params())
+        assert isinstance(sim, SynchronousSimulation)
+
+        sim.setup()
+        assert sim.params_to_dict()[0]["model"] == "synchronous"
+        assert "beh" not in sim.params_to_dict()[0]
+
+    def test_ragged_ranges(self):
+        entries, owners = ragged_ranges(np.array([5, 0, 9]), np.array([2, 0, 3]))
+
+        assert entries.tolist() == [5, 6, 9, 10, 11]
+        assert owners.tolist() == [0, 0, 2, 2, 2]
+
+    def test_profile_groups(self):
+        beh = np.array([[0, 0, 1], [1, 1, 1], [0, 0, 1], [0, 1, 1]])
+        groups = profile_groups(beh, radius=1)
+
+        labels = groups["labels"]
+        assert labels[0] == labels[2]
+        assert len(set(labels.tolist())) == 3
+
+        for a in set(labels.tolist()):
+            start = groups["member_starts"][a]
+            members = groups["members"][start : start + groups["member_counts"][a]]
+            assert set(members.tolist()) == set(np.flatnonzero(labels == a).tolist())
+
+            offsets = groups["profile_offsets"]
+            nearby = groups["profile_neighbors"][offsets[a] : offsets[a + 1]]
+            profile = beh[labels == a][0]
+            expected = {labels[i] for i in range(4) if (beh[i] != profile).sum() <= 1}
+            assert set(nearby.tolist()) == expected
+
+    def test_distinct_draws(self):
+        sizes = np.array([0, 3, 10, 7, 1000])
+        for seed in range(20):
+            rows, values = distinct_draws(sizes, 5, np.random.default_rng(seed))
+
+            assert np.bincount(rows, minlength=5).tolist() == [0, 3, 5, 5, 5]
+            assert (values < sizes[rows]).all()
+            assert len(set(zip(rows.tolist(), values.tolist()))) == len(rows)
+
+    def test_sample_non_neighbors(self):
+        edges = np.array([[0, 1], [0, 2], [1, 3], [2, 3]])
+        neighbors, offsets, edge_ids = adjacency(edges, 5)
+        assert neighbors[offsets[0] : offsets[1]].tolist() == [1, 2]
+        assert neighbors[offsets[3] : offsets[4]].tolist() == [1, 2]
+        assert edges[edge_ids[offsets[3] : offsets[4]]].tolist() == [[1, 3], [2, 3]]
+
+        draws = sample_non_neighbors(
+            neighbors, offsets, 5, 50, np.random.default_rng(1)
+        )
+
+        drawn = {v: set() for v in range(5)}
+        for v, alter in draws.tolist():
+            drawn[v].add(alter)
+
+        assert drawn[0] == {3, 4}
+        assert drawn[1] == {2, 4}
+        assert drawn[4] == {0, 1, 2, 3}
+
+        # with few draws, each vertex still gets k different non-neighbors
+        for seed in range(20):
+            draws = sample_non_neighbors(
+                neighbors, offsets, 5, 2, np.random.default_rng(seed)
+            )
+            assert len(np.unique(draws, axis=0)) == len(draws)
+            assert np.bincount(draws[:, 0]).tolist() == [2, 2, 2, 2, 2]
+
+        # the adjacency lists of vertices 3 and 4 only
+        draws = sample_non_neighbors(
+            neighbors[offsets[3] :],
+            offsets[3:] - offsets[3],
+            5,
+            50,
+            np.random.default_rng(1),
+            first=3,
+        )
+        assert set(map(tuple, draws.tolist())) == {
+            (3, 0),
+            (3, 4),
+            (4, 0),
+            (4, 1),
+            (4, 2),
+            (4, 3),
+        }
+
+    def test_tick(self, sim_params):
+        random.seed(1234)
+        sim = build_simulation(model="synchronous", **sim_params())
+        sim.setup()
+        sim.go()
+
+        assert sim.cur_tick == 8
+        assert len(sim.history["agents"]) == 9
+        assert (sim.beh == Intervention.behavior_matrix(sim.agents)).all()
+        assert sim.interventions[0].beh_changed > 0
+        assert not any(sim.network.is_multiple())
+
+    def test_network_step(self, sim_params):
+        # Without behavior changes, one tick connects exactly the agents that
+        # are similar enough
+        random.seed(1234)
+        params = sim_params(p_emul=0, p_spon_change=0)
+        sim = build_simulation(model="synchronous", **params)
+        sim.setup()
+
+        old_beh = sim.beh.copy()
+        sim.tick()
+
+        assert (sim.beh == old_beh).all()
+
+        expected = {
+            (u, v)
+            for u, v in combinations(range(sim.n_agents), 2)
+            if (old_beh[u] == old_beh[v]).mean() >= sim.sim_thresh
+        }
+        assert set(sim.network.get_edgelist()) == expected
+
+        for agent in sim.agents:
+            assert agent.emulatable_alters >= agent.pruned_alters
+
+    def test_sampled_recruitment(self, sim_params):
+        random.seed(1234)
+        params = sim_params(recruitment="sampled", recruit_k=3, metrics=True)
+        sim = build_simulation(model="synchronous", **params)
+        sim.setup()
+        sim.tick()
+
+        assert all([a.recruit_candidates <= 3 for a in sim.agents])
+
+        # both ends of a new edge count it, as with exhaustive recruitment
+        assert sim.metrics.counts["edges_added"] > 0
+        assert sum([a.recruited_alters for a in sim.agents]) == (
+            2 * sim.metrics.counts["edges_added"]
+        )
+        assert not any(sim.network.is_multiple())
+
+    def test_workers(self, monkeypatch, sim_params):
+        # Several small shards, which give the same results in one process as
+        # spread over a pool
+        monkeypatch.setattr(synchronous, "SHARD_SIZE", 7)
+
+        results = []
+        for workers in [1, 2]:
+            random.seed(1234)
+            sim = build_simulation(model="synchronous", workers=workers, **sim_params())
+            sim.setup()
+            sim.go()
+
+            assert sim.shard_pool is None
+            results.append((sim.beh.tolist(), sorted(sim.network.get_edgelist())))
+
+        assert results[0] == results[1]